@@ -1,23 +1,43 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, File, Query, Request, Response, UploadFile, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Query as SQLQuery, Session
+from pydantic import TypeAdapter
 from typing import List, Optional
-import uvicorn
+from contextlib import closing
+from itertools import islice
+import heapq
+import json
 
-from database import get_db, engine
-from models import Base, User, AuthUser
-from schemas import UserCreate, UserUpdate, UserResponse, AuthUserCreate, LoginRequest, TokenResponse
-from auth import create_access_token, get_current_user, verify_password, get_password_hash
+from database import get_db, get_session_factory, engine, current_client
+from models import Base, User, AuthUser, ImportJob
+from schemas import (
+    UserCreate, UserUpdate, UserResponse, UserBatchRequest, UserBatchResponse, UserChangesResponse,
+    UserSuggestion, ImportJobResponse, AuthUserCreate, LoginRequest, TokenResponse
+)
+from auth import create_access_token, get_current_user, verify_and_update_password, get_password_hash
 from seed_data import seed_database
+from fieldsets import parse_fields, select_fields, row_to_dict
+from changes import get_changes, migrate_user_versions
+from user_imports import import_manager, detect_format, job_response
+from user_snapshot import UserSnapshot, user_snapshot
+from coalesce import user_reads
+from user_suggest import user_suggest, suggest_from_database, create_suggest_indexes
+from slow_queries import slow_query_log, current_route
+from sharding import user_shards, get_user_db, get_user_read_db, get_unsharded_read_db
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+async def track_route(request: Request):
+    """Tag the request's statements with its route template, so /users/1 and /users/2 group together"""
+    # Async, so it runs in the request's own context before any other dependency
+    route = request.scope.get("route")
+    current_route.set(f"{request.method} {getattr(route, 'path', request.url.path)}")
 
 app = FastAPI(
     title="JSONPlaceholder Clone API",
     description="A backend API that replicates JSONPlaceholder with JWT authentication",
-    version="1.0.0"
+    version="1.0.0",
+    dependencies=[Depends(track_route)]
 )
 
 # Add CORS middleware
@@ -32,10 +52,40 @@ app.add_middleware(
 # Security
 security = HTTPBearer()
 
+# Maximum number of ids accepted by a single batch lookup
+MAX_BATCH_IDS = 500
+
+# Serialiser for user lists, built once
+USER_LIST = TypeAdapter(List[UserResponse])
+
+@app.middleware("http")
+async def track_client(request: Request, call_next):
+    """Identify the client so reads after its own writes stay on the primary"""
+    client = request.headers.get("authorization") or (request.client.host if request.client else None)
+    token = current_client.set(client)
+    try:
+        return await call_next(request)
+    finally:
+        current_client.reset(token)
+
 @app.on_event("startup")
 async def startup_event():
-    """Seed the database with initial data on startup"""
+    """Create tables and seed the database with initial data on startup"""
+    # Kept out of import time so importing the app never touches the database
+    Base.metadata.create_all(bind=engine)
+    migrate_user_versions(engine)
+    create_suggest_indexes(engine)
+    user_shards.create_all()
     seed_database()
+    import_manager.resume()
+    if not user_shards.enabled:
+        user_snapshot.start(get_session_factory())
+        user_suggest.start(get_session_factory())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Checkpoint running imports so they resume on the next start"""
+    import_manager.shutdown()
 
 @app.get("/")
 async def root():
@@ -63,7 +113,8 @@ async def register(user_data: AuthUserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    # Hashing is deliberately slow, so keep it off the event loop
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
     db_user = AuthUser(
         name=user_data.name,
         email=user_data.email,
@@ -81,46 +132,263 @@ async def register(user_data: AuthUserCreate, db: Session = Depends(get_db)):
 async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     """Login user and return JWT token"""
     user = db.query(AuthUser).filter(AuthUser.email == login_data.email).first()
-    if not user or not verify_password(login_data.password, user.password_hash):
+    if user:
+        verified, new_hash = await run_in_threadpool(
+            verify_and_update_password, login_data.password, user.password_hash
+        )
+    if not user or not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
+
+    # Upgrade a hash made with an older scheme or cost now that the password is known
+    if new_hash:
+        user.password_hash = new_hash
+        db.commit()
     
     access_token = create_access_token(data={"sub": user.email})
     return TokenResponse(access_token=access_token, token_type="bearer")
 
 # User endpoints (following JSONPlaceholder structure)
+def unique_batch_ids(ids: List[int]) -> List[int]:
+    """Validate the size of a batch lookup and drop duplicate ids, keeping request order"""
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_IDS} ids can be requested at once"
+        )
+    return list(dict.fromkeys(ids))
+
+def get_users_by_ids(query: SQLQuery, ids: List[int]):
+    """Fetch users in one query, in request order, along with the ids that were not found"""
+    ids = unique_batch_ids(ids)
+    found = {user.id: user for user in query.filter(User.id.in_(ids)).all()} if ids else {}
+    users = [found[user_id] for user_id in ids if user_id in found]
+    missing = [user_id for user_id in ids if user_id not in found]
+    return users, missing
+
+def get_sharded_users(skip: int, limit: int, ids: Optional[List[int]], paths):
+    """Fetch a page of users, or users by id, from the shards, along with missing ids"""
+    query = lambda db: user_query(db, paths)
+    if ids is None:
+        return user_shards.page(skip, limit, query), []
+
+    ids = unique_batch_ids(ids)
+    found = user_shards.get_many(ids, query)
+    return [found[user_id] for user_id in ids if user_id in found], [user_id for user_id in ids if user_id not in found]
+
+def require_unsharded(feature: str):
+    """Reject features that rely on all users living in one database"""
+    if user_shards.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=f"{feature} is not available when users are sharded"
+        )
+
+def get_snapshot_users_by_ids(snapshot: UserSnapshot, ids: List[int]):
+    """Encoded users from the snapshot as a JSON array, in request order, along with the ids that were not found"""
+    ids = unique_batch_ids(ids)
+    payloads = [snapshot.get(user_id) for user_id in ids]
+    missing = [user_id for user_id, payload in zip(ids, payloads) if payload is None]
+    return b"[" + b",".join(payload for payload in payloads if payload is not None) + b"]", missing
+
+def get_users_from_snapshot(snapshot: UserSnapshot, skip: int, limit: int, ids: Optional[List[int]]) -> Response:
+    """Serve a user list straight from the in-memory snapshot's pre-encoded rows"""
+    if ids is None:
+        return Response(content=snapshot.page(skip, limit), media_type="application/json")
+
+    content, missing = get_snapshot_users_by_ids(snapshot, ids)
+    headers = {"X-Missing-Ids": ",".join(str(user_id) for user_id in missing)} if missing else {}
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def fields_key(paths):
+    """Order-independent form of parsed fields for coalescing keys"""
+    return tuple(sorted(paths)) if paths is not None else None
+
+def user_query(db: Session, paths) -> SQLQuery:
+    """Query for whole users, or only the requested field paths"""
+    return db.query(User) if paths is None else select_fields(db, paths)
+
+def load_users(db: Session, skip: int, limit: int, ids: Optional[List[int]], paths):
+    """Query and serialise a user list, returning the JSON body and extra headers"""
+    if user_shards.enabled:
+        users, missing = get_sharded_users(skip, limit, ids, paths)
+    elif ids is not None:
+        users, missing = get_users_by_ids(user_query(db, paths), ids)
+    else:
+        users, missing = user_query(db, paths).offset(skip).limit(limit).all(), []
+
+    headers = {}
+    if missing:
+        headers["X-Missing-Ids"] = ",".join(str(user_id) for user_id in missing)
+
+    # Sparse fieldsets skip response model validation entirely
+    if paths is not None:
+        return json.dumps([row_to_dict(row, paths) for row in users]).encode(), headers
+    return USER_LIST.dump_json(USER_LIST.validate_python(users, from_attributes=True)), headers
+
+def load_user(db: Session, user_id: int, paths) -> bytes:
+    """Query and serialise a single user as JSON"""
+    user = user_query(db, paths).filter(User.id == user_id).first()
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if paths is not None:
+        return json.dumps(row_to_dict(user, paths)).encode()
+    return UserResponse.model_validate(user).model_dump_json().encode()
+
 @app.get("/users", response_model=List[UserResponse])
 async def get_users(
     skip: int = 0, 
     limit: int = 100, 
+    id: Optional[List[int]] = Query(None),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_unsharded_read_db),
+    session_factory = Depends(get_session_factory),
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Get all users with pagination, or specific users with ?id=1&id=2"""
+    paths = parse_fields(fields) if fields is not None else None
+    if user_snapshot.enabled and paths is None and not user_shards.enabled:
+        snapshot = await run_in_threadpool(user_snapshot.current, session_factory)
+        if snapshot is not None:
+            return get_users_from_snapshot(snapshot, skip, limit, id)
+
+    key = ("users", db.get_bind(), skip, limit, tuple(id) if id is not None else None, fields_key(paths))
+    content, headers = await user_reads.do(key, load_users, db, skip, limit, id, paths)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def load_users_batch(db: Session, ids: List[int]) -> bytes:
+    """Query and serialise a batch lookup as a UserBatchResponse"""
+    if user_shards.enabled:
+        users, missing = get_sharded_users(0, 0, ids, None)
+    else:
+        users, missing = get_users_by_ids(db.query(User), ids)
+    return UserBatchResponse(users=users, missing=missing).model_dump_json().encode()
+
+@app.post("/users/_mget", response_model=UserBatchResponse)
+async def get_users_batch(
+    batch: UserBatchRequest,
+    db: Session = Depends(get_unsharded_read_db),
+    session_factory = Depends(get_session_factory),
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Get many users by ID in a single query"""
+    ids = unique_batch_ids(batch.ids)
+    if user_snapshot.enabled and not user_shards.enabled:
+        snapshot = await run_in_threadpool(user_snapshot.current, session_factory)
+        if snapshot is not None:
+            users, missing = get_snapshot_users_by_ids(snapshot, ids)
+            return Response(
+                content=b'{"users":' + users + b',"missing":' + json.dumps(missing).encode() + b"}",
+                media_type="application/json"
+            )
+
+    key = ("mget", db.get_bind(), tuple(ids))
+    content = await user_reads.do(key, load_users_batch, db, ids)
+    return Response(content=content, media_type="application/json")
+
+@app.get("/users/changes", response_model=UserChangesResponse)
+async def get_user_changes(
+    since: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_unsharded_read_db),
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Get users created, updated or deleted after a change version"""
+    require_unsharded("The change feed")
+    return get_changes(db, since, limit)
+
+def suggest_from_shards(prefix: str, limit: int) -> List[dict]:
+    """Suggestions from every shard, merged in name order"""
+    results = user_shards.fan_out(lambda shard, db: suggest_from_database(db, prefix, limit))
+    merged = heapq.merge(*results.values(), key=lambda user: (user["name"], user["id"]))
+    return list(islice(merged, limit))
+
+@app.get("/users/suggest", response_model=List[UserSuggestion])
+async def suggest_users(
+    prefix: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_unsharded_read_db),
+    session_factory = Depends(get_session_factory),
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Typeahead: users whose name, username, email or company name starts with a prefix"""
+    if user_shards.enabled:
+        return await run_in_threadpool(suggest_from_shards, prefix, limit)
+    if user_suggest.enabled:
+        results = await run_in_threadpool(user_suggest.search, session_factory, prefix, limit)
+        if results is not None:
+            return results
+    return await run_in_threadpool(suggest_from_database, db, prefix, limit)
+
+@app.get("/users/count")
+async def count_users(
+    db: Session = Depends(get_unsharded_read_db),
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Number of users"""
+    if user_shards.enabled:
+        return {"count": await run_in_threadpool(user_shards.count)}
+    return {"count": db.query(User).count()}
+
+@app.post("/users/imports", response_model=ImportJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_user_import(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    session_factory = Depends(get_session_factory),
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Start a background import of users from a JSON, NDJSON or CSV file"""
+    require_unsharded("Bulk import")
+    format = detect_format(file.filename)
+    if format is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Import file must be .json, .ndjson, .jsonl or .csv"
+        )
+
+    chunks = iter(lambda: file.file.read(1024 * 1024), b"")
+    job = await run_in_threadpool(import_manager.create_job, db, file.filename, format, chunks)
+    import_manager.submit(job.id, session_factory)
+    return job_response(job)
+
+@app.get("/users/imports/{job_id}", response_model=ImportJobResponse)
+async def get_user_import(
+    job_id: str,
     db: Session = Depends(get_db),
     current_user: AuthUser = Depends(get_current_user)
 ):
-    """Get all users with pagination"""
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+    """Get progress of a user import"""
+    job = db.get(ImportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return job_response(job)
 
 @app.get("/users/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: int, 
-    db: Session = Depends(get_db),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_user_read_db),
+    session_factory = Depends(get_session_factory),
     current_user: AuthUser = Depends(get_current_user)
 ):
     """Get a specific user by ID"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    paths = parse_fields(fields) if fields is not None else None
+    if user_snapshot.enabled and paths is None and not user_shards.enabled:
+        snapshot = await run_in_threadpool(user_snapshot.current, session_factory)
+        if snapshot is not None:
+            payload = snapshot.get(user_id)
+            if payload is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            return Response(content=payload, media_type="application/json")
 
-@app.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def create_user(
-    user_data: UserCreate, 
-    db: Session = Depends(get_db),
-    current_user: AuthUser = Depends(get_current_user)
-):
-    """Create a new user"""
+    key = ("user", db.get_bind(), user_id, fields_key(paths))
+    content = await user_reads.do(key, load_user, db, user_id, paths)
+    return Response(content=content, media_type="application/json")
+
+def insert_user(db: Session, user_data: UserCreate) -> User:
+    """Insert a user unless its ID is taken"""
     # Check if user with this ID already exists
     existing_user = db.query(User).filter(User.id == user_data.id).first()
     if existing_user:
@@ -135,11 +403,23 @@ async def create_user(
     db.refresh(db_user)
     return db_user
 
+@app.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+async def create_user(
+    user_data: UserCreate, 
+    db: Session = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Create a new user"""
+    if user_shards.enabled:
+        with closing(user_shards.session(user_data.id)) as shard_db:
+            return insert_user(shard_db, user_data)
+    return insert_user(db, user_data)
+
 @app.put("/users/{user_id}", response_model=UserResponse)
 async def update_user(
     user_id: int, 
     user_data: UserUpdate, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_db),
     current_user: AuthUser = Depends(get_current_user)
 ):
     """Update a user (full update)"""
@@ -159,7 +439,7 @@ async def update_user(
 async def partial_update_user(
     user_id: int, 
     user_data: UserUpdate, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_db),
     current_user: AuthUser = Depends(get_current_user)
 ):
     """Partially update a user"""
@@ -178,7 +458,7 @@ async def partial_update_user(
 @app.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_db),
     current_user: AuthUser = Depends(get_current_user)
 ):
     """Delete a user"""
@@ -192,7 +472,7 @@ async def delete_user(
 
 # JSONPlaceholder compatible endpoints (without authentication for compatibility)
 @app.get("/users/{user_id}/posts")
-async def get_user_posts(user_id: int, db: Session = Depends(get_db)):
+async def get_user_posts(user_id: int, db: Session = Depends(get_user_read_db)):
     """Get posts for a specific user (placeholder endpoint)"""
     # Check if user exists
     user = db.query(User).filter(User.id == user_id).first()
@@ -203,7 +483,7 @@ async def get_user_posts(user_id: int, db: Session = Depends(get_db)):
     return []
 
 @app.get("/users/{user_id}/todos")
-async def get_user_todos(user_id: int, db: Session = Depends(get_db)):
+async def get_user_todos(user_id: int, db: Session = Depends(get_user_read_db)):
     """Get todos for a specific user (placeholder endpoint)"""
     # Check if user exists
     user = db.query(User).filter(User.id == user_id).first()
@@ -214,7 +494,7 @@ async def get_user_todos(user_id: int, db: Session = Depends(get_db)):
     return []
 
 @app.get("/users/{user_id}/albums")
-async def get_user_albums(user_id: int, db: Session = Depends(get_db)):
+async def get_user_albums(user_id: int, db: Session = Depends(get_user_read_db)):
     """Get albums for a specific user (placeholder endpoint)"""
     # Check if user exists
     user = db.query(User).filter(User.id == user_id).first()
@@ -224,5 +504,27 @@ async def get_user_albums(user_id: int, db: Session = Depends(get_db)):
     # Return empty albums array (placeholder)
     return []
 
+# Admin endpoints
+@app.get("/admin/coalescing")
+async def get_coalescing_stats(current_user: AuthUser = Depends(get_current_user)):
+    """Counters of identical concurrent reads that shared one query"""
+    return user_reads.stats()
+
+@app.get("/admin/slow-queries")
+async def get_slow_queries(current_user: AuthUser = Depends(get_current_user)):
+    """Slowest statements by total time, with their query plans"""
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "queries": slow_query_log.report()
+    }
+
+@app.delete("/admin/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_slow_queries(current_user: AuthUser = Depends(get_current_user)):
+    """Clear the slow query report"""
+    slow_query_log.reset()
+    return None
+
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(app, host="0.0.0.0", port=8000)
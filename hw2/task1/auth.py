@@ -1,7 +1,9 @@
+import argparse
+import os
+import time
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import List, Optional, Tuple
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
@@ -14,22 +16,71 @@ SECRET_KEY = "your-secret-key-here-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing: new hashes use the first scheme, the others are still
+# accepted and rehashed on the next successful login
+PASSWORD_SCHEMES = [scheme.strip() for scheme in os.getenv("PASSWORD_SCHEMES", "bcrypt").split(",") if scheme.strip()]
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
 
-# Security
-security = HTTPBearer()
+# Target hashing time for `python auth.py calibrate`
+PASSWORD_HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS", "250"))
+
+def make_password_context(
+    schemes: List[str],
+    bcrypt_rounds: int = BCRYPT_ROUNDS,
+    argon2_time_cost: int = ARGON2_TIME_COST,
+    argon2_memory_cost: int = ARGON2_MEMORY_COST,
+    argon2_parallelism: int = ARGON2_PARALLELISM
+):
+    """CryptContext hashing with schemes[0] that flags other schemes and other costs for rehashing"""
+    from passlib.context import CryptContext
+
+    settings = {}
+    if "bcrypt" in schemes:
+        # Equal min and max desired rounds make any other cost need an update, up or down
+        settings.update(
+            bcrypt__default_rounds=bcrypt_rounds,
+            bcrypt__min_desired_rounds=bcrypt_rounds,
+            bcrypt__max_desired_rounds=bcrypt_rounds
+        )
+    if "argon2" in schemes:
+        settings.update(
+            argon2__time_cost=argon2_time_cost,
+            argon2__memory_cost=argon2_memory_cost,
+            argon2__parallelism=argon2_parallelism
+        )
+    return CryptContext(schemes=schemes, deprecated="auto", **settings)
+
+@lru_cache(maxsize=None)
+def password_context():
+    """Password hashing context, created on first use so passlib and its backends load lazily"""
+    return make_password_context(PASSWORD_SCHEMES)
+
+# Security (missing credentials are reported as 401 by get_current_user)
+security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also return a new hash when the stored one uses an old scheme or cost"""
+    try:
+        return password_context().verify_and_update(plain_password, hashed_password)
+    except ValueError:
+        # A hash from a scheme no longer in PASSWORD_SCHEMES can't be checked
+        return False, None
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return password_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -42,6 +93,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 def verify_token(token: str) -> Optional[str]:
     """Verify and decode a JWT token"""
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -52,7 +105,7 @@ def verify_token(token: str) -> Optional[str]:
         return None
 
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     db: Session = Depends(get_db)
 ) -> AuthUser:
     """Get the current authenticated user"""
@@ -62,11 +115,11 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        email = verify_token(credentials.credentials)
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    if credentials is None:
+        raise credentials_exception
+
+    email = verify_token(credentials.credentials)
+    if email is None:
         raise credentials_exception
     
     user = db.query(AuthUser).filter(AuthUser.email == email).first()
@@ -74,3 +127,90 @@ async def get_current_user(
         raise credentials_exception
     
     return user
+
+def hash_time(context, samples: int = 3) -> float:
+    """Median seconds to hash a password with a context"""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash("calibration-password")
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)[len(timings) // 2]
+
+def calibrate_bcrypt(target_seconds: float, samples: int = 3) -> Tuple[int, float]:
+    """Highest bcrypt rounds whose hash time fits the target (at least the minimum of 4)"""
+    rounds, seconds = 4, hash_time(make_password_context(["bcrypt"], bcrypt_rounds=4), samples)
+    # Each extra round doubles the work, so stop at the first cost over the target
+    while rounds < 31:
+        candidate = hash_time(make_password_context(["bcrypt"], bcrypt_rounds=rounds + 1), samples)
+        if candidate > target_seconds:
+            break
+        rounds, seconds = rounds + 1, candidate
+    return rounds, seconds
+
+def calibrate_argon2(target_seconds: float, memory_cost: int, parallelism: int, samples: int = 3) -> Tuple[int, float]:
+    """Highest argon2 time cost at a fixed memory cost whose hash time fits the target (at least 1)"""
+    def measure(time_cost: int) -> float:
+        context = make_password_context(
+            ["argon2"], argon2_time_cost=time_cost,
+            argon2_memory_cost=memory_cost, argon2_parallelism=parallelism
+        )
+        return hash_time(context, samples)
+
+    # Time grows about linearly with time cost: start from the estimate, then correct it
+    time_cost, seconds = 1, measure(1)
+    estimate = max(1, int(target_seconds / seconds))
+    while estimate > 1:
+        estimated_seconds = measure(estimate)
+        if estimated_seconds <= target_seconds:
+            time_cost, seconds = estimate, estimated_seconds
+            break
+        estimate -= 1
+    while True:
+        candidate = measure(time_cost + 1)
+        if candidate > target_seconds:
+            break
+        time_cost, seconds = time_cost + 1, candidate
+    return time_cost, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = commands.add_parser("calibrate", help="Pick hashing costs that fit a target latency on this host")
+    calibrate_parser.add_argument("--target-ms", type=float, default=PASSWORD_HASH_TARGET_MS)
+    calibrate_parser.add_argument("--schemes", default=",".join(PASSWORD_SCHEMES))
+    calibrate_parser.add_argument("--argon2-memory-cost", type=int, default=ARGON2_MEMORY_COST, help="KiB")
+    calibrate_parser.add_argument("--argon2-parallelism", type=int, default=ARGON2_PARALLELISM)
+    calibrate_parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    target = args.target_ms / 1000
+    schemes = [scheme.strip() for scheme in args.schemes.split(",") if scheme.strip()]
+    unknown = [scheme for scheme in schemes if scheme not in ("bcrypt", "argon2")]
+    if unknown:
+        parser.error(f"cannot calibrate {', '.join(unknown)}; supported schemes are bcrypt and argon2")
+
+    settings = {"PASSWORD_SCHEMES": ",".join(schemes)}
+    for scheme in schemes:
+        if scheme == "bcrypt":
+            rounds, seconds = calibrate_bcrypt(target, args.samples)
+            settings["BCRYPT_ROUNDS"] = rounds
+            print(f"bcrypt: {rounds} rounds hash in {seconds * 1e3:.0f}ms")
+        else:
+            time_cost, seconds = calibrate_argon2(target, args.argon2_memory_cost, args.argon2_parallelism, args.samples)
+            settings.update(
+                ARGON2_TIME_COST=time_cost,
+                ARGON2_MEMORY_COST=args.argon2_memory_cost,
+                ARGON2_PARALLELISM=args.argon2_parallelism
+            )
+            print(f"argon2: time cost {time_cost} at {args.argon2_memory_cost} KiB "
+                  f"hashes in {seconds * 1e3:.0f}ms")
+        if seconds > target:
+            print(f"  even the lowest {scheme} cost is over the {args.target_ms:.0f}ms target")
+
+    print(f"\n# Fits a {args.target_ms:.0f}ms target on this host")
+    for name, value in settings.items():
+        print(f"{name}={value}")
+
+if __name__ == "__main__":
+    main()
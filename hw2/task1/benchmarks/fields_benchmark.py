@@ -0,0 +1,119 @@
+"""Benchmark sparse fieldsets against full user rows.
+
+Usage (from hw2/task1):
+    python benchmarks/fields_benchmark.py --users 100000 --page-size 100 --fields id,name,email
+
+Reports the bytes read from the database and serialised per row, in-process
+rows per second through the app's list loader, and requests per second through
+GET /users, with and without ?fields=.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snapshot_benchmark import make_user
+
+def column_bytes(engine, query) -> int:
+    """Bytes of column data the database returns for a query, as stored"""
+    sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(sql)
+        return sum(len(str(value).encode()) for row in cursor.fetchall() for value in row if value is not None)
+    finally:
+        connection.close()
+
+async def request_rate(app, token, urls, concurrency):
+    """GET every url over `concurrency` connections; returns requests per second and mean body size"""
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    sizes = []
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark", headers=headers) as client:
+        async def worker(offset):
+            for url in urls[offset::concurrency]:
+                response = await client.get(url)
+                response.raise_for_status()
+                sizes.append(len(response.content))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+        return len(urls) / (time.perf_counter() - started), sum(sizes) / len(sizes)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=500)
+    # Deep OFFSETs scan the skipped rows whatever is selected, which would hide the difference
+    parser.add_argument("--max-skip", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--fields", default="id,name,email")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'fields.db')}"
+    # Measure every query: no slow-query EXPLAINs, no sharing identical pages
+    os.environ["SLOW_QUERY_LOG"] = "false"
+    os.environ["COALESCE_READS"] = "false"
+
+    from database import SessionLocal, engine
+    from models import Base, User
+    from fieldsets import parse_fields
+    from app import app, load_users, user_query
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    for start in range(1, args.users + 1, 10000):
+        db.add_all([User(**make_user(user_id)) for user_id in range(start, min(start + 10000, args.users + 1))])
+        db.commit()
+    db.expunge_all()
+    print(f"Seeded {args.users} users")
+
+    paths = parse_fields(args.fields)
+    variants = [("full rows", None), (f"?fields={args.fields}", paths)]
+    offsets = [random.randrange(0, min(args.max_skip, args.users - args.page_size) + 1) for _ in range(args.pages)]
+
+    rates = []
+    for label, variant_paths in variants:
+        sample = user_query(db, variant_paths).offset(0).limit(args.page_size)
+        read_bytes = column_bytes(engine, sample) / args.page_size
+        body_bytes = len(load_users(db, 0, args.page_size, None, variant_paths)[0]) / args.page_size
+
+        started = time.perf_counter()
+        for offset in offsets:
+            load_users(db, offset, args.page_size, None, variant_paths)
+            db.expunge_all()
+        rate = len(offsets) * args.page_size / (time.perf_counter() - started)
+        rates.append(rate)
+        print(f"{label:>24}: {read_bytes:6.0f} bytes read/row, {body_bytes:6.0f} bytes JSON/row, "
+              f"{rate:,.0f} rows/s" + (f" ({rate / rates[0]:.1f}x)" if len(rates) > 1 else ""))
+
+    # The same pages through the HTTP app, including auth and routing
+    from auth import create_access_token, get_password_hash
+    from models import AuthUser
+
+    db.add(AuthUser(name="Benchmark", email="benchmark@example.com", password_hash=get_password_hash("benchmark")))
+    db.commit()
+    db.close()
+    token = create_access_token(data={"sub": "benchmark@example.com"})
+
+    offsets = offsets[:args.requests]
+    results = []
+    for label, query in [("full rows", ""), (f"?fields={args.fields}", f"&fields={args.fields}")]:
+        urls = [f"/users?skip={offset}&limit={args.page_size}{query}" for offset in offsets]
+        rps, size = asyncio.run(request_rate(app, token, urls, args.concurrency))
+        results.append(rps)
+        print(f"GET /users {label:>24} ({args.concurrency} concurrent): {rps:,.0f} requests/s, "
+              f"{size:,.0f} bytes/response" + (f" ({rps / results[0]:.1f}x)" if len(results) > 1 else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark /auth/login throughput for several password hashing settings.
+
+Usage (from hw2/task1):
+    python benchmarks/login_benchmark.py --logins 200 --concurrency 8
+    python benchmarks/login_benchmark.py --config bcrypt:12 --config argon2:2:19456
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# scheme:cost[:memory KiB] settings compared by default
+DEFAULT_CONFIGS = ["bcrypt:10", "bcrypt:12", "argon2:2:19456", "argon2:3:65536"]
+
+USERS = 20
+PASSWORD = "benchmark-password"
+
+def parse_config(value):
+    """(scheme, cost settings) for "bcrypt:<rounds>" or "argon2:<time cost>[:<memory KiB>]" """
+    scheme, _, costs = value.partition(":")
+    costs = [int(cost) for cost in costs.split(":") if cost]
+    if scheme == "bcrypt" and len(costs) == 1:
+        return scheme, {"bcrypt_rounds": costs[0]}
+    if scheme == "argon2" and len(costs) == 1:
+        return scheme, {"argon2_time_cost": costs[0]}
+    if scheme == "argon2" and len(costs) == 2:
+        return scheme, {"argon2_time_cost": costs[0], "argon2_memory_cost": costs[1]}
+    raise ValueError(f"expected bcrypt:<rounds> or argon2:<time cost>[:<memory KiB>], got {value!r}")
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+async def run_logins(app, logins, concurrency):
+    """Log the benchmark users in `logins` times over `concurrency` connections"""
+    import httpx
+
+    latencies = []
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+        async def worker(offset):
+            for number in range(offset, logins, concurrency):
+                started = time.perf_counter()
+                response = await client.post(
+                    "/auth/login", json={"email": f"login{number % USERS}@example.com", "password": PASSWORD}
+                )
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+        return time.perf_counter() - started, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--config", action="append", help="bcrypt:<rounds> or argon2:<time cost>[:<memory KiB>]")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'login.db')}"
+
+    import auth
+    from app import app
+    from database import SessionLocal, engine
+    from models import Base, AuthUser
+
+    Base.metadata.create_all(bind=engine)
+
+    def store_hashes(context):
+        db = SessionLocal()
+        db.query(AuthUser).delete()
+        db.add_all(
+            AuthUser(name=f"Login {number}", email=f"login{number}@example.com", password_hash=context.hash(PASSWORD))
+            for number in range(USERS)
+        )
+        db.commit()
+        db.close()
+
+    configs = args.config or DEFAULT_CONFIGS
+    for config in configs:
+        scheme, costs = parse_config(config)
+        context = auth.make_password_context([scheme], **costs)
+        auth.password_context = lambda: context
+        store_hashes(context)
+
+        seconds, latencies = asyncio.run(run_logins(app, args.logins, args.concurrency))
+        print(f"{config:>16}: {args.logins / seconds:7.1f} logins/s, "
+              f"p50 {percentile(latencies, 0.5) * 1e3:6.0f}ms, p99 {percentile(latencies, 0.99) * 1e3:6.0f}ms "
+              f"({args.concurrency} concurrent)")
+
+    # The first login after a scheme or cost change verifies the old hash and stores a new one
+    (old_scheme, old_costs), (new_scheme, new_costs) = parse_config(configs[0]), parse_config(configs[-1])
+    store_hashes(auth.make_password_context([old_scheme], **old_costs))
+    migration = auth.make_password_context(list(dict.fromkeys([new_scheme, old_scheme])), **{**old_costs, **new_costs})
+    auth.password_context = lambda: migration
+    _, latencies = asyncio.run(run_logins(app, USERS, args.concurrency))
+    print(f"First logins after moving from {configs[0]} to {configs[-1]}: "
+          f"p50 {percentile(latencies, 0.5) * 1e3:.0f}ms, including the rehash")
+
+if __name__ == "__main__":
+    main()
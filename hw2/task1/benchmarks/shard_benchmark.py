@@ -0,0 +1,95 @@
+"""Benchmark sharded users on local SQLite files against a single database.
+
+Usage (from hw2/task1):
+    python benchmarks/shard_benchmark.py --users 50000 --shards 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snapshot_benchmark import make_user
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+def best_of(runs, fn, *args):
+    """Fastest of several runs, so connection and thread start-up are not counted"""
+    return min(timed(fn, *args) for _ in range(runs))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'primary.db')}"
+
+    from sqlalchemy import func
+    from models import User
+    from sharding import UserShards
+
+    single = UserShards({"single": f"sqlite:///{os.path.join(directory, 'single.db')}"})
+    sharded = UserShards({
+        f"shard{index}": f"sqlite:///{os.path.join(directory, f'shard{index}.db')}"
+        for index in range(args.shards)
+    })
+
+    def insert_range(shards, start, stop):
+        """Insert users one transaction each, like POST /users"""
+        for user_id in range(start, stop):
+            db = shards.session(user_id)
+            try:
+                db.add(User(**make_user(user_id)))
+                db.commit()
+            finally:
+                db.close()
+
+    def concurrent_inserts(shards):
+        step = -(-args.users // args.writers)
+        with ThreadPoolExecutor(max_workers=args.writers) as pool:
+            futures = [
+                pool.submit(insert_range, shards, start, min(start + step, args.users + 1))
+                for start in range(1, args.users + 1, step)
+            ]
+            for future in futures:
+                future.result()
+
+    def lookups(shards, ids):
+        for user_id in ids:
+            db = shards.session(user_id)
+            try:
+                db.query(User).filter(User.id == user_id).one()
+            finally:
+                db.close()
+
+    def page(shards, skip, limit):
+        if shards is single:
+            # The unsharded path: OFFSET/LIMIT on one database
+            return shards.fan_out(lambda shard, db: db.query(User).order_by(User.id).offset(skip).limit(limit).all())
+        return shards.page(skip, limit, lambda db: db.query(User))
+
+    ids = [random.randint(1, args.users) for _ in range(args.lookups)]
+    for label, shards in (("1 database", single), (f"{args.shards} shards", sharded)):
+        shards.create_all()
+        seconds = timed(concurrent_inserts, shards)
+        print(f"{label}:")
+        print(f"  inserts ({args.writers} writers): {args.users / seconds:,.0f} users/s")
+        print(f"  point reads:                 {args.lookups / timed(lookups, shards, ids):,.0f} reads/s")
+        print(f"  page skip=0 limit=100:       {best_of(5, page, shards, 0, 100) * 1e3:.1f}ms")
+        print(f"  page skip=10000 limit=100:   {best_of(5, page, shards, 10000, 100) * 1e3:.1f}ms")
+        count_seconds = best_of(5, lambda: shards.fan_out(lambda shard, db: db.query(func.count(User.id)).scalar()))
+        print(f"  count:                       {count_seconds * 1e3:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark the in-memory user snapshot against the SQLAlchemy read path.
+
+Usage (from hw2/task1):
+    python benchmarks/snapshot_benchmark.py --users 100000 --requests 5000 --concurrency 8
+
+Reports in-process lookups and requests per second through the app's
+GET /users/{id}, with snapshot mode off and on.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def make_user(user_id):
+    """Synthetic user shaped like the JSONPlaceholder data"""
+    return {
+        "id": user_id,
+        "name": f"User {user_id}",
+        "username": f"user{user_id}",
+        "email": f"user{user_id}@example.com",
+        "address": {
+            "street": "Kulas Light",
+            "suite": f"Apt. {user_id % 1000}",
+            "city": "Gwenborough",
+            "zipcode": "92998-3874",
+            "geo": {"lat": "-37.3159", "lng": "81.1496"}
+        },
+        "phone": "1-770-736-8031 x56442",
+        "website": "hildegard.org",
+        "company": {
+            "name": "Romaguera-Crona",
+            "catchPhrase": "Multi-layered client-server neural-net",
+            "bs": "harness real-time e-markets"
+        }
+    }
+
+async def request_rate(app, token, ids, concurrency):
+    """GET /users/{id} for every id over `concurrency` connections; returns requests per second"""
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark", headers=headers) as client:
+        async def worker(offset):
+            for user_id in ids[offset::concurrency]:
+                response = await client.get(f"/users/{user_id}")
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+        return len(ids) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=5000)
+    # Stay under the default pool size (15): dependencies check connections out on the event loop
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'snapshot.db')}"
+
+    from database import SessionLocal, engine
+    from models import Base, User
+    from schemas import UserResponse
+    from user_snapshot import UserSnapshotStore
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    for start in range(1, args.users + 1, 10000):
+        db.add_all([User(**make_user(user_id)) for user_id in range(start, min(start + 10000, args.users + 1))])
+        db.commit()
+    print(f"Seeded {args.users} users")
+
+    store = UserSnapshotStore(enabled=True)
+    started = time.perf_counter()
+    store.current(SessionLocal)
+    build_seconds = time.perf_counter() - started
+
+    # Build a second copy under tracemalloc, which is too slow to time
+    store.snapshot = None
+    db.expunge_all()
+    tracemalloc.start()
+    store.current(SessionLocal)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"Snapshot build: {build_seconds:.2f}s")
+    print(f"Snapshot memory: {memory / 2**20:.1f} MiB "
+          f"(~{memory / args.users * 1_000_000 / 2**20:.0f} MiB per million users)")
+
+    ids = [random.randint(1, args.users) for _ in range(args.lookups)]
+
+    started = time.perf_counter()
+    for user_id in ids:
+        UserResponse.model_validate(db.query(User).filter(User.id == user_id).first()).model_dump_json()
+        db.expunge_all()
+    orm_rate = len(ids) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for user_id in ids:
+        store.current(SessionLocal).get(user_id)
+    snapshot_rate = len(ids) / (time.perf_counter() - started)
+
+    print(f"In-process lookup via SQLAlchemy + pydantic: {orm_rate:,.0f} lookups/s")
+    print(f"In-process lookup via snapshot:              {snapshot_rate:,.0f} lookups/s "
+          f"({snapshot_rate / orm_rate:.0f}x)")
+
+    # The same reads through the HTTP app, including auth and routing
+    from app import app
+    from auth import create_access_token, get_password_hash
+    from models import AuthUser
+    from user_snapshot import user_snapshot
+
+    db.add(AuthUser(name="Benchmark", email="benchmark@example.com", password_hash=get_password_hash("benchmark")))
+    db.commit()
+    db.close()
+    token = create_access_token(data={"sub": "benchmark@example.com"})
+
+    ids = ids[:args.requests]
+    user_snapshot.enabled = False
+    database_rps = asyncio.run(request_rate(app, token, ids, args.concurrency))
+    user_snapshot.enabled = True
+    asyncio.run(request_rate(app, token, ids[:1], 1))  # build the snapshot outside the timing
+    snapshot_rps = asyncio.run(request_rate(app, token, ids, args.concurrency))
+    print(f"GET /users/{{id}} ({args.concurrency} concurrent), database: {database_rps:,.0f} requests/s")
+    print(f"GET /users/{{id}} ({args.concurrency} concurrent), snapshot: {snapshot_rps:,.0f} requests/s "
+          f"({snapshot_rps / database_rps:.1f}x)")
+
+if __name__ == "__main__":
+    main()
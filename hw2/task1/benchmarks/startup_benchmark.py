@@ -0,0 +1,102 @@
+"""Measure what `import app` adds on top of its framework with -X importtime and check it against a budget.
+
+Usage (from hw2/task1):
+    python benchmarks/startup_benchmark.py --runs 5 --budget-ratio 0.25
+
+FastAPI and SQLAlchemy's ORM are imported first in the same interpreter, so the
+budget is a fraction of their import time on this host rather than a fixed
+number of milliseconds. Exits with status 1 when the median time `app` adds is
+over budget, when a module that should load lazily is imported, or when
+importing touches the database.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed on first use: seeding, password hashing, JWTs, `python app.py`
+LAZY_MODULES = ("requests", "passlib", "jose", "uvicorn")
+
+# Imports every app needs; the app's own cost is measured on top of them
+FRAMEWORK_MODULES = ("fastapi", "sqlalchemy.orm")
+
+STARTUP_BUDGET_RATIO = float(os.getenv("STARTUP_BUDGET_RATIO", "0.25"))
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+def measure_import(database_path):
+    """Import the framework, then the app, in a fresh interpreter.
+
+    Returns {module: (cumulative us, depth)} and the app's direct imports as
+    [(cumulative us, module)].
+    """
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(FRAMEWORK_MODULES)}; import app"],
+        cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"import app failed:\n{result.stderr}")
+
+    modules = {}
+    # -X importtime lists a module's imports before the module itself
+    children, direct = [], []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            _, cumulative, indent, name = match.groups()
+            depth = (len(indent) - 1) // 2
+            modules[name] = (int(cumulative), depth)
+            if depth == 1:
+                children.append((int(cumulative), name))
+            elif depth == 0:
+                if name == "app":
+                    direct = children
+                children = []
+    return modules, direct
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ratio", type=float, default=STARTUP_BUDGET_RATIO)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    database_path = os.path.join(tempfile.mkdtemp(), "startup.db")
+    runs = [measure_import(database_path) for _ in range(args.runs)]
+    times = [modules["app"][0] / 1000 for modules, _ in runs]
+    median = statistics.median(times)
+    framework = statistics.median(
+        sum(modules[name][0] for name in FRAMEWORK_MODULES) / 1000 for modules, _ in runs
+    )
+    budget_ms = framework * args.budget_ratio
+
+    # Heaviest modules imported directly by the app, from the last run
+    modules, direct = runs[-1]
+    direct = sorted(direct, reverse=True)
+    print(f"import {' + '.join(FRAMEWORK_MODULES)}: median {framework:.0f}ms")
+    print(f"import app on top: median {median:.0f}ms, min {min(times):.0f}ms over {args.runs} runs "
+          f"(budget {budget_ms:.0f}ms = {args.budget_ratio:.0%} of the framework)")
+    for cumulative, name in direct[:args.top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+
+    failures = []
+    if median > budget_ms:
+        failures.append(f"median import time {median:.0f}ms is over the {budget_ms:.0f}ms budget")
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        failures.append(f"imported at startup instead of lazily: {', '.join(eager)}")
+    if os.path.exists(database_path):
+        failures.append("importing the app opened the database")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Benchmark the typeahead prefix index, optionally against the database fallback.
+
+Usage (from hw2/task1):
+    python benchmarks/suggest_benchmark.py --users 1000000
+    python benchmarks/suggest_benchmark.py --users 100000 --compare-database
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIRST_NAMES = ["Leanne", "Ervin", "Clementine", "Patricia", "Chelsey", "Dennis", "Kurtis", "Nicholas", "Glenna", "Clementina"]
+LAST_NAMES = ["Graham", "Howell", "Bauch", "Lebsack", "Dietrich", "Schulist", "Weissnat", "Runolfsdottir", "Reichert", "DuBuque"]
+COMPANIES = ["Romaguera-Crona", "Deckow-Crist", "Robel-Corkery", "Keebler LLC", "Considine-Lockman", "Johns Group", "Abernathy Group", "Yost and Sons", "Hoeger LLC"]
+
+def make_row(user_id):
+    """Synthetic (id, name, username, email, company name) row"""
+    first, last = random.choice(FIRST_NAMES), random.choice(LAST_NAMES)
+    return (
+        user_id, f"{first} {last}", f"{first.lower()}{user_id}",
+        f"{first.lower()}.{last.lower()}{user_id}@example.com", random.choice(COMPANIES)
+    )
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--searches", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--compare-database", action="store_true")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'suggest.db')}"
+
+    from user_suggest import SuggestIndex, suggest_from_database
+
+    random.seed(0)
+    rows = [make_row(user_id) for user_id in range(1, args.users + 1)]
+
+    started = time.perf_counter()
+    index = SuggestIndex.build(0, rows)
+    build_seconds = time.perf_counter() - started
+
+    # Build a second copy under tracemalloc, which is too slow to time, from
+    # freshly made rows so the strings are counted as they would be from the database
+    tracemalloc.start()
+    copy = SuggestIndex.build(0, (make_row(user_id) for user_id in range(1, args.users + 1)))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del copy
+    print(f"Index build for {args.users} users: {build_seconds:.2f}s, "
+          f"{len(index.keys):,} keys, {memory / 2**20:.0f} MiB")
+
+    words = [name.lower() for name in FIRST_NAMES + LAST_NAMES + COMPANIES]
+    prefixes = [random.choice(words)[:random.randint(1, 5)] for _ in range(args.searches)]
+
+    timings = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        index.search(prefix, args.limit)
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentiles(timings)
+    print(f"Index search (top {args.limit}): p50 {p50 * 1e6:.1f}us, p99 {p99 * 1e6:.1f}us")
+
+    timings = []
+    for user_id in random.sample(range(1, args.users + 1), 1000):
+        started = time.perf_counter()
+        index.upsert(user_id, make_row(user_id)[1:])
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentiles(timings)
+    print(f"Index update: p50 {p50 * 1e6:.1f}us, p99 {p99 * 1e6:.1f}us")
+
+    timings = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        index.search(prefix, args.limit)
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentiles(timings)
+    print(f"Index search with {len(index.delta_keys):,} delta keys: p50 {p50 * 1e6:.1f}us, p99 {p99 * 1e6:.1f}us")
+
+    entries = len(index.delta_keys) + len(index.stale)
+    started = time.perf_counter()
+    index.compact()
+    print(f"Compaction of {entries:,} pending entries: {(time.perf_counter() - started) * 1e3:.0f}ms")
+
+    if not args.compare_database:
+        return
+
+    from database import SessionLocal, engine
+    from models import Base, User
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    for start in range(0, args.users, 10000):
+        db.execute(User.__table__.insert(), [
+            {
+                "id": user_id, "name": name, "username": username, "email": email,
+                "address": {}, "phone": "", "website": "", "company": {"name": company}, "version": 0
+            }
+            for user_id, name, username, email, company in rows[start:start + 10000]
+        ])
+        db.commit()
+
+    timings = []
+    for prefix in prefixes[:200]:
+        started = time.perf_counter()
+        suggest_from_database(db, prefix, args.limit)
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentiles(timings)
+    print(f"Database fallback ({engine.dialect.name}): p50 {p50 * 1e3:.1f}ms, p99 {p99 * 1e3:.1f}ms")
+    db.close()
+
+if __name__ == "__main__":
+    main()
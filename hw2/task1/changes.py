@@ -0,0 +1,125 @@
+from sqlalchemy import bindparam, event, inspect, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from typing import Callable, List
+
+from models import User, UserTombstone, ChangeCounter
+from schemas import UserChange, UserChangesResponse
+
+# Callbacks run after a transaction that wrote users commits
+user_commit_hooks: List[Callable[[], None]] = []
+
+# Users given a version per transaction when backfilling an existing table
+BACKFILL_BATCH_SIZE = 10000
+
+def allocate_versions(session: Session, count: int) -> List[int]:
+    """Reserve `count` consecutive change versions in the current transaction"""
+    # Row lock on the counter keeps versions in commit order
+    last = session.execute(
+        update(ChangeCounter)
+        .where(ChangeCounter.id == 1)
+        .values(version=ChangeCounter.version + count)
+        .returning(ChangeCounter.version)
+    ).scalar()
+    if last is None:
+        session.execute(ChangeCounter.__table__.insert().values(id=1, version=count))
+        last = count
+    return list(range(last - count + 1, last + 1))
+
+def migrate_user_versions(engine: Engine):
+    """Add users.version to a table created before delta sync and version every unversioned user.
+
+    Backfilled versions come from the change counter, so a first sync with since=0
+    returns users that existed before the column did.
+    """
+    inspector = inspect(engine)
+    columns = {column["name"]: column for column in inspector.get_columns(User.__tablename__)}
+    indexes = {index["name"] for index in inspector.get_indexes(User.__tablename__)}
+    # DDL locks users even when it turns out to be a no-op, so only run what is missing
+    if "version" not in columns or "ix_users_version" not in indexes:
+        with engine.begin() as connection:
+            if "version" not in columns:
+                connection.exec_driver_sql("ALTER TABLE users ADD COLUMN version BIGINT")
+            connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_users_version ON users (version)")
+
+    table = User.__table__
+    unversioned = (table.c.version.is_(None)) | (table.c.version == 0)
+    while True:
+        with Session(bind=engine) as session, session.begin():
+            ids = session.execute(
+                select(table.c.id).where(unversioned).order_by(table.c.id).limit(BACKFILL_BATCH_SIZE)
+            ).scalars().all()
+            if not ids:
+                break
+            versions = allocate_versions(session, len(ids))
+            session.connection().execute(
+                table.update().where(table.c.id == bindparam("user_id")).values(version=bindparam("new_version")),
+                [{"user_id": user_id, "new_version": version} for user_id, version in zip(ids, versions)]
+            )
+
+    version_nullable = "version" not in columns or columns["version"]["nullable"]
+    if engine.dialect.name == "postgresql" and version_nullable:
+        with engine.begin() as connection:
+            connection.exec_driver_sql("ALTER TABLE users ALTER COLUMN version SET NOT NULL")
+
+@event.listens_for(Session, "before_flush")
+def _version_user_changes(session, flush_context, instances):
+    """Stamp written users with a new version and leave tombstones for deletes"""
+    created = [obj for obj in session.new if isinstance(obj, User)]
+    updated = [
+        obj for obj in session.dirty
+        if isinstance(obj, User) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, User)]
+    if not (created or updated or deleted):
+        return
+    session.info["user_changes"] = True
+
+    with session.no_autoflush:
+        versions = iter(allocate_versions(session, len(created) + len(updated) + len(deleted)))
+        for user in created + updated:
+            user.version = next(versions)
+
+        # A re-created id is no longer deleted
+        if created:
+            session.query(UserTombstone).filter(
+                UserTombstone.id.in_([user.id for user in created])
+            ).delete(synchronize_session=False)
+
+        for user in deleted:
+            session.merge(UserTombstone(id=user.id, version=next(versions)))
+
+@event.listens_for(Session, "after_commit")
+def _run_user_commit_hooks(session):
+    """Notify in-process caches that users changed"""
+    if session.info.pop("user_changes", False):
+        for hook in user_commit_hooks:
+            hook()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_changes(session):
+    """Forget user changes that were rolled back"""
+    session.info.pop("user_changes", None)
+
+def get_changes(db: Session, since: int, limit: int) -> UserChangesResponse:
+    """Return user upserts and deletes with a version above `since`, oldest first"""
+    users = (
+        db.query(User).filter(User.version > since)
+        .order_by(User.version).limit(limit + 1).all()
+    )
+    tombstones = (
+        db.query(UserTombstone).filter(UserTombstone.version > since)
+        .order_by(UserTombstone.version).limit(limit + 1).all()
+    )
+
+    changes = [UserChange(version=user.version, id=user.id, deleted=False, user=user) for user in users]
+    changes += [
+        UserChange(version=tombstone.version, id=tombstone.id, deleted=True)
+        for tombstone in tombstones
+    ]
+    changes.sort(key=lambda change: change.version)
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    next_since = changes[-1].version if changes else since
+    return UserChangesResponse(changes=changes, next_since=next_since, has_more=has_more)
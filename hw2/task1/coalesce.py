@@ -0,0 +1,85 @@
+import asyncio
+import os
+from typing import Any, Callable, Dict, Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+from changes import user_commit_hooks
+
+# Coalescing configuration
+COALESCE_READS = os.getenv("COALESCE_READS", "true").lower() in ("1", "true", "yes")
+COALESCE_WAIT_SECONDS = float(os.getenv("COALESCE_WAIT_SECONDS", "5"))
+
+class SingleFlight:
+    """Runs one call per key at a time and shares its result with concurrent callers"""
+
+    def __init__(self, enabled: bool = COALESCE_READS, wait_seconds: float = COALESCE_WAIT_SECONDS):
+        self.enabled = enabled
+        self.wait_seconds = wait_seconds
+        self.generation = 0
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def invalidate(self):
+        """Stop sharing calls that started before a write"""
+        self.generation += 1
+
+    def stats(self) -> dict:
+        """Counters of calls made and duplicate calls saved"""
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "saved": self.shared - self.timeouts,
+        }
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(*args) in the threadpool, or wait for an identical call already running"""
+        if not self.enabled:
+            return await run_in_threadpool(fn, *args)
+
+        loop = asyncio.get_running_loop()
+        key = (self.generation, key)
+        future = self._in_flight.get(key)
+        if future is not None and future.get_loop() is loop:
+            self.shared += 1
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.wait_seconds)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+            except asyncio.CancelledError:
+                # Only our own cancellation propagates; an abandoned leader means we run it ourselves
+                if not future.cancelled():
+                    raise
+                self.timeouts += 1
+            return await run_in_threadpool(fn, *args)
+
+        future = loop.create_future()
+        self._in_flight[key] = future
+        self.leaders += 1
+        try:
+            result = await run_in_threadpool(fn, *args)
+        except Exception as e:
+            self.errors += 1
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody was waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if not future.done():
+                future.cancel()
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+user_reads = SingleFlight()
+
+# Reads started before a user write must not be shared with later requests
+user_commit_hooks.append(user_reads.invalidate)
@@ -0,0 +1,137 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+# Each pytest-xdist worker ("gw0", "gw1", ...) gets a database of its own
+WORKER = os.getenv("PYTEST_XDIST_WORKER", "main")
+
+def worker_database_url() -> str:
+    """Database URL for this worker, derived from TEST_DATABASE_URL when set"""
+    base_url = os.getenv("TEST_DATABASE_URL")
+    if base_url is None:
+        return f"sqlite:///{os.path.join(tempfile.gettempdir(), f'jsonplaceholder-test-{WORKER}.db')}"
+    url = make_url(base_url)
+    return url.set(database=f"{url.database}_{WORKER}").render_as_string(hide_password=False)
+
+TEST_DATABASE_URL = worker_database_url()
+
+# The app creates its engine at import time, keep it off the development database
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+from app import app
+from auth import create_access_token, get_password_hash
+from database import Base, get_db, get_session_factory, engine_options
+from models import AuthUser
+
+def create_worker_database(url: str):
+    """Start from an empty database for this worker"""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        if url.database and os.path.exists(url.database):
+            os.remove(url.database)
+        return
+
+    admin = create_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    with admin.connect() as connection:
+        connection.execute(text(f'DROP DATABASE IF EXISTS "{url.database}"'))
+        connection.execute(text(f'CREATE DATABASE "{url.database}"'))
+    admin.dispose()
+
+@pytest.fixture(scope="session")
+def engine():
+    """Engine for this worker's database, with all tables created"""
+    create_worker_database(TEST_DATABASE_URL)
+    test_engine = create_engine(TEST_DATABASE_URL, **engine_options(TEST_DATABASE_URL))
+
+    if test_engine.dialect.name == "sqlite":
+        # Let SQLAlchemy issue BEGIN itself so SAVEPOINTs work with pysqlite
+        @event.listens_for(test_engine, "connect")
+        def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(test_engine, "begin")
+        def _begin(connection):
+            connection.exec_driver_sql("BEGIN")
+
+    Base.metadata.create_all(bind=test_engine)
+    yield test_engine
+    test_engine.dispose()
+
+    url = make_url(TEST_DATABASE_URL)
+    if url.get_backend_name() == "sqlite" and url.database and os.path.exists(url.database):
+        os.remove(url.database)
+
+@pytest.fixture(scope="session")
+def auth_password_hash():
+    """bcrypt hash of the test password, computed once per worker"""
+    return get_password_hash("testpassword")
+
+@pytest.fixture(scope="session")
+def auth_user(engine, auth_password_hash):
+    """Authentication user shared by all tests, committed before any test transaction"""
+    db = sessionmaker(bind=engine)()
+    user = AuthUser(
+        name="Test Auth User",
+        email="auth@example.com",
+        password_hash=auth_password_hash
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+    return user
+
+@pytest.fixture(scope="session")
+def auth_token(auth_user):
+    """Token for the shared authentication user, issued without a bcrypt login"""
+    return create_access_token(data={"sub": auth_user.email})
+
+@pytest.fixture
+def connection(engine, auth_user):
+    """Connection whose outer transaction is rolled back after each test"""
+    connection = engine.connect()
+    transaction = connection.begin()
+    yield connection
+    transaction.rollback()
+    connection.close()
+
+@pytest.fixture
+def session_factory(connection):
+    """Sessions whose commits only release a SAVEPOINT inside the test transaction"""
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=connection,
+        join_transaction_mode="create_savepoint"
+    )
+
+@pytest.fixture
+def db_session(session_factory):
+    """Database session fixture"""
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@pytest.fixture
+def client(session_factory):
+    """Test client whose requests run inside the test transaction"""
+    from fastapi.testclient import TestClient
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
+    yield TestClient(app)
+    app.dependency_overrides.clear()
@@ -0,0 +1,68 @@
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy.orm import Query, Session
+from typing import Dict, List, Tuple
+
+from models import User
+from schemas import UserResponse
+
+def _schema_paths(model, prefix=()):
+    """Yield every field path of a schema along with whether it is a nested object"""
+    for name, field in model.model_fields.items():
+        path = prefix + (name,)
+        annotation = field.annotation
+        is_object = isinstance(annotation, type) and issubclass(annotation, BaseModel)
+        yield path, is_object
+        if is_object:
+            yield from _schema_paths(annotation, path)
+
+# Selectable ?fields= paths, e.g. "company.name" -> (("company", "name"), False)
+FIELD_PATHS: Dict[str, Tuple[Tuple[str, ...], bool]] = {
+    ".".join(path): (path, is_object) for path, is_object in _schema_paths(UserResponse)
+}
+
+def parse_fields(fields: str) -> List[Tuple[str, ...]]:
+    """Parse a ?fields= value into field paths, dropping paths covered by a parent"""
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in FIELD_PATHS]
+    if not names or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested"
+        )
+
+    paths = sorted({FIELD_PATHS[name][0] for name in names}, key=len)
+    selected = []
+    for path in paths:
+        if not any(path[:len(parent)] == parent for parent in selected):
+            selected.append(path)
+    return selected
+
+def _column(path: Tuple[str, ...]):
+    """SQL expression selecting a single field path"""
+    column = getattr(User, path[0])
+    if len(path) == 1:
+        return column
+
+    # Extract nested values inside the database instead of loading the whole blob
+    element = column[path[1]] if len(path) == 2 else column[path[1:]]
+    if FIELD_PATHS[".".join(path)][1]:
+        return element
+    return element.as_string()
+
+def select_fields(db: Session, paths: List[Tuple[str, ...]]) -> Query:
+    """Query selecting only the requested field paths (plus the id)"""
+    columns = [User.id.label("id")]
+    columns += [_column(path).label(".".join(path)) for path in paths if path != ("id",)]
+    return db.query(*columns)
+
+def row_to_dict(row, paths: List[Tuple[str, ...]]) -> dict:
+    """Build a nested response dict from a row returned by select_fields"""
+    values = row._mapping
+    result = {}
+    for path in paths:
+        target = result
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = values[".".join(path)]
+    return result
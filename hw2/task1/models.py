@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Text, JSON, DateTime, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 from database import Base
 
@@ -14,6 +14,27 @@ class User(Base):
     phone = Column(String(50), nullable=False)
     website = Column(String(255), nullable=False)
     company = Column(JSON, nullable=False)  # Store company as JSON
+    version = Column(BigInteger, nullable=False, default=0, index=True)  # Change version of the last write
+
+class UserTombstone(Base):
+    """Marker left behind by a deleted user for delta sync"""
+    __tablename__ = "user_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, index=True)
+
+class ChangeCounter(Base):
+    """Single-row counter handing out change versions"""
+    __tablename__ = "change_counter"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False)
+
+event.listen(
+    ChangeCounter.__table__,
+    "after_create",
+    DDL("INSERT INTO change_counter (id, version) VALUES (1, 0)")
+)
 
 class AuthUser(Base):
     """Authentication user model for JWT authentication"""
@@ -23,3 +44,21 @@ class AuthUser(Base):
     name = Column(String(255), nullable=False)
     email = Column(String(255), nullable=False, unique=True)
     password_hash = Column(String(255), nullable=False)
+
+class ImportJob(Base):
+    """Background user import job, doubling as its resume checkpoint"""
+    __tablename__ = "import_jobs"
+
+    id = Column(String(36), primary_key=True)
+    filename = Column(String(255), nullable=False)
+    path = Column(String(1024), nullable=False)  # Spooled upload on local disk
+    format = Column(String(10), nullable=False)
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    rows_processed = Column(Integer, nullable=False, default=0)  # Checkpoint: rows handled so far
+    rows_imported = Column(Integer, nullable=False, default=0)
+    rows_failed = Column(Integer, nullable=False, default=0)
+    resumed_from = Column(Integer, nullable=False, default=0)  # Checkpoint at the last (re)start
+    errors = Column(JSON, nullable=False, default=list)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
 # Geo schema
 class Geo(BaseModel):
@@ -48,6 +49,48 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class UserBatchRequest(BaseModel):
+    ids: List[int]
+
+class UserBatchResponse(BaseModel):
+    users: List[UserResponse]
+    missing: List[int]
+
+class UserSuggestion(BaseModel):
+    id: int
+    name: str
+    username: str
+    email: str
+    company: str
+
+class UserChange(BaseModel):
+    version: int
+    id: int
+    deleted: bool
+    user: Optional[UserResponse] = None
+
+class UserChangesResponse(BaseModel):
+    changes: List[UserChange]
+    next_since: int
+    has_more: bool
+
+class ImportJobResponse(BaseModel):
+    id: str
+    filename: str
+    format: str
+    status: str
+    rows_processed: int
+    rows_imported: int
+    rows_failed: int
+    rows_per_second: Optional[float] = None
+    errors: List[Dict[str, Any]]
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # Authentication schemas
 class AuthUserBase(BaseModel):
     name: str
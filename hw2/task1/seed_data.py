@@ -1,15 +1,26 @@
-import requests
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import User
+from sharding import user_shards
+
+def save_users(db: Session, users):
+    """Insert users into the database, or onto their shards when sharded"""
+    if user_shards.enabled:
+        user_shards.add_all(users)
+        return
+    db.add_all(users)
+    db.commit()
 
 def seed_database():
     """Seed the database with initial user data from JSONPlaceholder"""
+    # requests is only needed here, keep it out of the app's import time
+    import requests
+
     db = SessionLocal()
     
     try:
         # Check if data already exists
-        existing_users = db.query(User).count()
+        existing_users = user_shards.count() if user_shards.enabled else db.query(User).count()
         if existing_users > 0:
             print(f"Database already contains {existing_users} users. Skipping seed.")
             return
@@ -21,6 +32,7 @@ def seed_database():
         users_data = response.json()
         
         # Create user objects and add to database
+        users = []
         for user_data in users_data:
             db_user = User(
                 id=user_data["id"],
@@ -32,9 +44,9 @@ def seed_database():
                 website=user_data["website"],
                 company=user_data["company"]
             )
-            db.add(db_user)
+            users.append(db_user)
         
-        db.commit()
+        save_users(db, users)
         print(f"Successfully seeded database with {len(users_data)} users.")
         
     except requests.RequestException as e:
@@ -121,9 +133,5 @@ def seed_with_fallback_data(db: Session):
         }
     ]
     
-    for user_data in fallback_users:
-        db_user = User(**user_data)
-        db.add(db_user)
-    
-    db.commit()
+    save_users(db, [User(**user_data) for user_data in fallback_users])
     print(f"Successfully seeded database with {len(fallback_users)} fallback users.")
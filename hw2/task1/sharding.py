@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import heapq
+import os
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from fastapi import Depends
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import Query, Session, sessionmaker
+
+from database import Base, get_db, get_read_db, engine_options
+from models import User, UserTombstone, ChangeCounter
+from changes import migrate_user_versions
+from user_suggest import create_suggest_indexes
+
+# Comma-separated shard databases, each optionally named as name=url
+USER_SHARD_URLS = os.getenv("USER_SHARD_URLS", "")
+
+# Points per shard on the hash ring; more points spread users more evenly
+USER_SHARD_VNODES = int(os.getenv("USER_SHARD_VNODES", "64"))
+
+# Tables that live on every shard: users plus what versioning writes alongside them
+SHARD_TABLES = [User.__table__, UserTombstone.__table__, ChangeCounter.__table__]
+
+# Columns copied when a user moves between shards (the version is re-stamped)
+USER_COLUMNS = ("id", "name", "username", "email", "address", "phone", "website", "company")
+
+T = TypeVar("T")
+
+def parse_shard_urls(value: str) -> Dict[str, str]:
+    """Map shard names to URLs; unnamed shards are called shard0, shard1, ..."""
+    shards = {}
+    for position, entry in enumerate(part.strip() for part in value.split(",") if part.strip()):
+        name, separator, url = entry.partition("=")
+        if not separator or ":" in name:
+            name, url = f"shard{position}", entry
+        shards[name] = url
+    return shards
+
+def ring_hash(value: str) -> int:
+    """Stable 64-bit position on the hash ring"""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Consistent hash ring: adding or removing a shard only moves the ids next to its points"""
+
+    def __init__(self, names: Iterable[str], vnodes: int = USER_SHARD_VNODES):
+        points = sorted(
+            (ring_hash(f"{name}#{vnode}"), name) for name in names for vnode in range(vnodes)
+        )
+        self.points = [point for point, _ in points]
+        self.names = [name for _, name in points]
+
+    def owner(self, user_id: int) -> str:
+        """Shard owning an id: the first point clockwise from the id's hash"""
+        position = bisect_right(self.points, ring_hash(str(user_id)))
+        return self.names[position % len(self.names)]
+
+class Shard:
+    """One shard database"""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.engine = create_engine(url, **engine_options(url))
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+class UserShards:
+    """Routes user rows to shards and fans queries out across all of them"""
+
+    def __init__(self, urls: Dict[str, str], vnodes: int = USER_SHARD_VNODES):
+        self.shards = {name: Shard(name, url) for name, url in urls.items()}
+        self.ring = HashRing(self.shards, vnodes)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether users are sharded at all"""
+        return bool(self.shards)
+
+    def create_all(self):
+        """Create the user tables on every shard"""
+        for shard in self.shards.values():
+            Base.metadata.create_all(bind=shard.engine, tables=SHARD_TABLES)
+            migrate_user_versions(shard.engine)
+            create_suggest_indexes(shard.engine)
+
+    def owner(self, user_id: int) -> Shard:
+        """Shard owning a user id"""
+        return self.shards[self.ring.owner(user_id)]
+
+    def session(self, user_id: int) -> Session:
+        """New session on the shard owning a user"""
+        return self.owner(user_id).SessionLocal()
+
+    def group(self, ids: Iterable[int]) -> Dict[str, List[int]]:
+        """Split ids by owning shard"""
+        groups: Dict[str, List[int]] = {}
+        for user_id in ids:
+            groups.setdefault(self.ring.owner(user_id), []).append(user_id)
+        return groups
+
+    def fan_out(self, fn: Callable[[Shard, Session], T], names: Optional[Iterable[str]] = None) -> Dict[str, T]:
+        """Run fn on each shard (or just `names`) concurrently, each with its own session"""
+        shards = [self.shards[name] for name in (self.shards if names is None else names)]
+
+        def run(shard: Shard) -> T:
+            db = shard.SessionLocal()
+            try:
+                return fn(shard, db)
+            finally:
+                db.close()
+
+        if len(shards) <= 1:
+            return {shard.name: run(shard) for shard in shards}
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="user-shard")
+        futures = {shard.name: self._executor.submit(run, shard) for shard in shards}
+        return {name: future.result() for name, future in futures.items()}
+
+    def get_many(self, ids: List[int], query: Callable[[Session], Query]) -> Dict[int, Any]:
+        """Rows for the given ids, keyed by id, each fetched from its owning shard"""
+        groups = self.group(ids)
+        results = self.fan_out(lambda shard, db: query(db).filter(User.id.in_(groups[shard.name])).all(), groups)
+        return {row.id: row for rows in results.values() for row in rows}
+
+    def page(self, skip: int, limit: int, query: Callable[[Session], Query]) -> List[Any]:
+        """Rows skip to skip + limit in id order across all shards"""
+        if skip == 0:
+            pages = self.fan_out(lambda shard, db: query(db).order_by(User.id).limit(limit).all())
+            return list(islice(merge_by_id(pages.values()), limit))
+
+        # Every shard has to return skip + limit ids for the merged page to be exact,
+        # so merge bare ids and load only the page's rows from their owners
+        id_lists = self.fan_out(
+            lambda shard, db: [user_id for (user_id,) in db.query(User.id).order_by(User.id).limit(skip + limit)]
+        )
+        page_ids = list(islice(heapq.merge(*id_lists.values()), skip, skip + limit))
+        rows = self.get_many(page_ids, query)
+        return [rows[user_id] for user_id in page_ids if user_id in rows]
+
+    def count(self, criteria=()) -> int:
+        """Count users matching criteria across all shards"""
+        counts = self.fan_out(lambda shard, db: db.query(func.count(User.id)).filter(*criteria).scalar())
+        return sum(counts.values())
+
+    def add_all(self, users: List[User]):
+        """Insert users on their owning shards, one transaction per shard"""
+        by_shard: Dict[str, List[User]] = {}
+        for user in users:
+            by_shard.setdefault(self.ring.owner(user.id), []).append(user)
+
+        def insert(shard: Shard, db: Session):
+            db.add_all(by_shard[shard.name])
+            db.commit()
+
+        self.fan_out(insert, by_shard)
+
+def merge_by_id(results: Iterable[List[T]]) -> Iterable[T]:
+    """k-way merge of per-shard results that are each sorted by id"""
+    return heapq.merge(*results, key=attrgetter("id"))
+
+user_shards = UserShards(parse_shard_urls(USER_SHARD_URLS))
+
+def _user_session(user_id: int, unsharded: Session):
+    """Yield the owning shard's session, or the given session when users are not sharded"""
+    if not user_shards.enabled:
+        yield unsharded
+        return
+    db = user_shards.session(user_id)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_user_db(user_id: int, primary: Session = Depends(get_db)):
+    """Dependency to get a session on the database that owns a user"""
+    yield from _user_session(user_id, primary)
+
+def get_unsharded_read_db(primary: Session = Depends(get_db)):
+    """Dependency to get a read session for users when they are not sharded: a replica or the primary.
+
+    Sharded reads go to the shards instead, so no replica is acquired for them and
+    the primary session is handed over unused; it never opens a connection.
+    """
+    if user_shards.enabled:
+        yield primary
+        return
+    yield from get_read_db(primary)
+
+def get_user_read_db(user_id: int, unsharded: Session = Depends(get_unsharded_read_db)):
+    """Dependency to get a read session for a user: its shard, or else the primary or a replica"""
+    yield from _user_session(user_id, unsharded)
+
+def rebalance(shards: UserShards, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, Dict[str, int]]:
+    """Move every user not on its owning shard there; returns moves as {source: {target: count}}"""
+    moves: Dict[str, Dict[str, int]] = {}
+    for source in shards.shards.values():
+        db = source.SessionLocal()
+        try:
+            last_id = None
+            while True:
+                query = db.query(User).order_by(User.id)
+                if last_id is not None:
+                    query = query.filter(User.id > last_id)
+                batch = query.limit(batch_size).all()
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                misplaced: Dict[str, List[User]] = {}
+                for user in batch:
+                    target = shards.ring.owner(user.id)
+                    if target != source.name:
+                        misplaced.setdefault(target, []).append(user)
+
+                for target, users in misplaced.items():
+                    moves.setdefault(source.name, {}).setdefault(target, 0)
+                    moves[source.name][target] += len(users)
+                    if dry_run:
+                        continue
+
+                    # Copy first, then delete: a rerun after a crash finds the copy and overwrites it
+                    target_db = shards.shards[target].SessionLocal()
+                    try:
+                        for user in users:
+                            target_db.merge(User(**{column: getattr(user, column) for column in USER_COLUMNS}))
+                        target_db.commit()
+                    finally:
+                        target_db.close()
+                    for user in users:
+                        db.delete(user)
+                    db.commit()
+                # Moved rows are gone, but the id cursor is unaffected
+                db.expunge_all()
+        finally:
+            db.close()
+    return moves
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage user shards configured by USER_SHARD_URLS")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebalance_parser = commands.add_parser("rebalance", help="Move users to the shard that owns them")
+    rebalance_parser.add_argument("--batch-size", type=int, default=1000)
+    rebalance_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if not user_shards.enabled:
+        parser.error("USER_SHARD_URLS is not set")
+
+    user_shards.create_all()
+    moves = rebalance(user_shards, args.batch_size, args.dry_run)
+    counts = user_shards.fan_out(lambda shard, db: db.query(func.count(User.id)).scalar())
+    verb = "Would move" if args.dry_run else "Moved"
+    for source, targets in moves.items():
+        for target, count in targets.items():
+            print(f"{verb} {count} users from {source} to {target}")
+    if not moves:
+        print("All users are on their owning shard")
+    for name, count in counts.items():
+        print(f"{name}: {count} users")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Slow query log configuration
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "true").lower() in ("1", "true", "yes")
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_TOP_N = int(os.getenv("SLOW_QUERY_TOP_N", "50"))
+
+# Tables where a full scan is worth flagging
+WATCHED_TABLES = ("users", "auth_users")
+
+# Routes kept per statement
+MAX_ROUTES = 5
+
+# Statements whose plan is remembered, so each is explained once even after it leaves the top-N
+MAX_EXPLAINED = 1000
+
+# Route template of the current request, set by an app-wide dependency
+current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?|:\w+")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_statement(statement: str) -> str:
+    """Collapse literals, placeholders and IN lists so similar statements group together"""
+    statement = _STRING.sub("?", statement)
+    statement = _PLACEHOLDER.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _LIST.sub("(?...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+def parameters_shape(parameters, executemany: bool):
+    """Describe parameters by type only, never by value"""
+    if executemany:
+        return f"executemany x{len(parameters)}"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+def explain(connection, statement: str, parameters) -> Optional[List[str]]:
+    """Fetch the query plan without running the statement"""
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        prefix = "EXPLAIN (ANALYZE off) "
+    elif dialect == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        return None
+
+    # Use a raw cursor so the EXPLAIN itself is not timed or recorded
+    cursor = connection.connection.cursor()
+    # A failed EXPLAIN would abort the request's open Postgres transaction, so fence it in a savepoint
+    savepoint = dialect == "postgresql" and not getattr(connection.connection.dbapi_connection, "autocommit", False)
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            raise
+        finally:
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    finally:
+        cursor.close()
+    return [str(row[-1]) for row in rows]
+
+def sequential_scans(plan: Optional[List[str]]) -> List[str]:
+    """Watched tables read with a full scan according to a plan"""
+    if not plan:
+        return []
+    scanned = []
+    for line in plan:
+        for table in WATCHED_TABLES:
+            # Postgres: "Seq Scan on users", SQLite: "SCAN users" / "SCAN TABLE users"
+            if re.search(rf"(Seq Scan on|\bSCAN(?: TABLE)?) {table}\b", line) and table not in scanned:
+                scanned.append(table)
+    return scanned
+
+class SlowQueryLog:
+    """Rolling top-N of slow statements by total time, grouped by normalised SQL.
+
+    Uses space-saving counting: once full, a new statement takes over the slot with
+    the least total time and inherits that total, so a statement that is slow again
+    and again can build up its total and climb into the report.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = SLOW_QUERY_LOG,
+        threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+        top_n: int = SLOW_QUERY_TOP_N,
+    ):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.top_n = top_n
+        self._entries: Dict[str, dict] = {}
+        # Normalised statement -> (plan, sequential scans); None while being explained
+        self._explained: "OrderedDict[str, Optional[Tuple[Optional[List[str]], List[str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget all recorded statements"""
+        with self._lock:
+            self._entries = {}
+            self._explained = OrderedDict()
+
+    def record(self, connection, statement: str, parameters, executemany: bool, duration_ms: float):
+        """Add a slow execution, capturing the plan the first time a statement is seen"""
+        key = normalize_statement(statement)
+        route = current_route.get()
+        now = datetime.utcnow()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = self._new_entry(key, statement, parameters, executemany, now)
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["last_seen"] = now
+            if route and route not in entry["routes"] and len(entry["routes"]) < MAX_ROUTES:
+                entry["routes"].append(route)
+
+            first_seen = key not in self._explained
+            if first_seen:
+                self._explained[key] = None
+                if len(self._explained) > MAX_EXPLAINED:
+                    self._explained.popitem(last=False)
+            else:
+                self._explained.move_to_end(key)
+                if self._explained[key] is not None:
+                    entry["plan"], entry["sequential_scans"] = self._explained[key]
+
+        if not first_seen:
+            return
+
+        plan = None
+        if not executemany and key.upper().startswith(("SELECT", "WITH")):
+            try:
+                plan = explain(connection, statement, parameters)
+            except Exception as e:
+                plan = [f"EXPLAIN failed: {e}"]
+        scans = sequential_scans(plan)
+        with self._lock:
+            if key in self._explained:
+                self._explained[key] = (plan, scans)
+            entry["plan"], entry["sequential_scans"] = plan, scans
+        logger.warning(
+            "Slow query (%.1f ms) on %s: %s%s", duration_ms, route, key,
+            f" [sequential scan on {', '.join(scans)}]" if scans else ""
+        )
+
+    def _new_entry(self, key: str, statement: str, parameters, executemany: bool, now: datetime) -> dict:
+        """Entry for a statement not in the report, replacing the cheapest one when full"""
+        inherited_ms, inherited_count = 0.0, 0
+        if len(self._entries) >= self.top_n:
+            cheapest = min(self._entries, key=lambda other: self._entries[other]["total_ms"])
+            evicted = self._entries.pop(cheapest)
+            inherited_ms, inherited_count = evicted["total_ms"], evicted["count"]
+        return {
+            "statement": key,
+            "sample": statement,
+            "parameters": parameters_shape(parameters, executemany),
+            "routes": [],
+            "count": inherited_count,
+            "total_ms": inherited_ms,
+            # Upper bound on how much of count and total_ms belongs to evicted statements
+            "error_count": inherited_count,
+            "error_ms": inherited_ms,
+            "max_ms": 0.0,
+            "plan": None,
+            "sequential_scans": [],
+            "first_seen": now,
+        }
+
+    def report(self) -> List[dict]:
+        """Recorded statements, most total time first"""
+        with self._lock:
+            entries = [dict(entry, routes=list(entry["routes"])) for entry in self._entries.values()]
+        for entry in entries:
+            # Average over this statement's own executions, without the inherited share
+            own_ms = entry["total_ms"] - entry["error_ms"]
+            entry["avg_ms"] = round(own_ms / max(entry["count"] - entry["error_count"], 1), 3)
+            entry["total_ms"] = round(entry["total_ms"], 3)
+            entry["error_ms"] = round(entry["error_ms"], 3)
+            entry["max_ms"] = round(entry["max_ms"], 3)
+        return sorted(entries, key=lambda entry: entry["total_ms"], reverse=True)
+
+slow_query_log = SlowQueryLog()
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(connection, cursor, statement, parameters, context, executemany):
+    """Remember when a statement started"""
+    # Kept on the statement's execution context, so a statement that raises
+    # (and never reaches after_cursor_execute) leaves nothing on the pooled connection
+    if context is not None:
+        context._slow_query_start = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_slow_query(connection, cursor, statement, parameters, context, executemany):
+    """Record statements slower than the threshold"""
+    started = getattr(context, "_slow_query_start", None)
+    if started is None or not slow_query_log.enabled:
+        return
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms >= slow_query_log.threshold_ms:
+        slow_query_log.record(connection, statement, parameters, executemany, duration_ms)
@@ -1,50 +1,32 @@
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
-
-from app import app
-from database import get_db, Base
-from models import User, AuthUser
-from auth import get_password_hash
-
-# Create in-memory SQLite database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-def override_get_db():
-    """Override database dependency for testing"""
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import InterfaceError
+from sqlalchemy.orm import Session
 
-app.dependency_overrides[get_db] = override_get_db
+import database
+from database import Base, ReplicaSet
+from models import User, AuthUser, ChangeCounter
+import changes
+import asyncio
+import auth
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+import user_imports
+from user_imports import ImportManager, import_manager
+from user_snapshot import user_snapshot
+import user_suggest as user_suggest_module
+from user_suggest import SuggestIndex, user_suggest
+from coalesce import SingleFlight
+import slow_queries
+from slow_queries import SlowQueryLog, slow_query_log, normalize_statement, sequential_scans
+from sharding import HashRing, UserShards, rebalance, user_shards
 
-@pytest.fixture
-def client():
-    """Test client fixture"""
-    return TestClient(app)
-
-@pytest.fixture
-def db_session():
-    """Database session fixture"""
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Database, client and auth fixtures live in conftest.py
 
 @pytest.fixture
 def sample_user_data():
@@ -74,27 +56,27 @@ def sample_user_data():
     }
 
 @pytest.fixture
-def auth_user(db_session):
-    """Create an authentication user for testing"""
-    hashed_password = get_password_hash("testpassword")
-    user = AuthUser(
-        name="Test Auth User",
-        email="auth@example.com",
-        password_hash=hashed_password
-    )
-    db_session.add(user)
-    db_session.commit()
-    db_session.refresh(user)
-    return user
+def shards(tmp_path, monkeypatch):
+    """Shard users across three SQLite files"""
+    sharded = UserShards({f"shard{index}": f"sqlite:///{tmp_path / f'shard{index}.db'}" for index in range(3)})
+    sharded.create_all()
+    monkeypatch.setattr(user_shards, "shards", sharded.shards)
+    monkeypatch.setattr(user_shards, "ring", sharded.ring)
+    return sharded
+
+def shard_user_ids(sharded: UserShards):
+    """Ids of the users stored on each shard"""
+    return sharded.fan_out(lambda shard, db: sorted(user_id for (user_id,) in db.query(User.id)))
 
 @pytest.fixture
-def auth_token(client, auth_user):
-    """Get authentication token for testing"""
-    response = client.post("/auth/login", json={
-        "email": "auth@example.com",
-        "password": "testpassword"
-    })
-    return response.json()["access_token"]
+def replica(tmp_path, monkeypatch):
+    """Route reads to a second SQLite file standing in for a replica"""
+    replicas = ReplicaSet([f"sqlite:///{tmp_path / 'replica.db'}"], read_your_writes_seconds=60)
+    replica = replicas.replicas[0]
+    Base.metadata.create_all(bind=replica.engine)
+    monkeypatch.setattr(database, "replica_set", replicas)
+    yield replica
+    replica.engine.dispose()
 
 class TestRootEndpoint:
     def test_root_endpoint(self, client):
@@ -105,6 +87,20 @@ class TestRootEndpoint:
         assert data["message"] == "JSONPlaceholder Clone API"
         assert data["version"] == "1.0.0"
 
+class TestStartup:
+    def test_import_is_lazy_and_offline(self, tmp_path):
+        """Test that importing the app neither loads lazy dependencies nor opens the database"""
+        database_path = tmp_path / "startup.db"
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, app; print(' '.join(sys.modules))"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}"),
+            capture_output=True, text=True, check=True
+        )
+        modules = set(result.stdout.split())
+        assert not modules & {"requests", "passlib", "jose", "uvicorn"}
+        assert not database_path.exists()
+
 class TestAuthentication:
     def test_register_user(self, client):
         """Test user registration"""
@@ -146,6 +142,72 @@ class TestAuthentication:
         })
         assert response.status_code == 401
 
+class TestPasswordRehash:
+    def use_context(self, monkeypatch, schemes, **costs):
+        """Swap in a cheap hashing context for this test"""
+        context = auth.make_password_context(
+            schemes, **{"bcrypt_rounds": 4, "argon2_time_cost": 1, "argon2_memory_cost": 1024, **costs}
+        )
+        monkeypatch.setattr(auth, "password_context", lambda: context)
+        return context
+
+    def register(self, client, password="rehashpassword"):
+        response = client.post("/auth/register", json={
+            "name": "Rehash User", "email": "rehash@example.com", "password": password
+        })
+        assert response.status_code == 200
+
+    def login(self, client, password="rehashpassword"):
+        return client.post("/auth/login", json={"email": "rehash@example.com", "password": password})
+
+    def stored_hash(self, db_session):
+        db_session.expire_all()
+        return db_session.query(AuthUser).filter(AuthUser.email == "rehash@example.com").one().password_hash
+
+    def test_login_rehashes_when_cost_changes(self, client, db_session, monkeypatch):
+        """A successful login stores a hash at the configured cost"""
+        self.use_context(monkeypatch, ["bcrypt"], bcrypt_rounds=4)
+        self.register(client)
+        assert self.stored_hash(db_session).startswith("$2b$04$")
+
+        self.use_context(monkeypatch, ["bcrypt"], bcrypt_rounds=5)
+        assert self.login(client, "wrongpassword").status_code == 401
+        assert self.stored_hash(db_session).startswith("$2b$04$")
+
+        assert self.login(client).status_code == 200
+        new_hash = self.stored_hash(db_session)
+        assert new_hash.startswith("$2b$05$")
+
+        # Already current: left alone
+        assert self.login(client).status_code == 200
+        assert self.stored_hash(db_session) == new_hash
+
+    def test_login_migrates_to_first_scheme(self, client, db_session, monkeypatch):
+        """bcrypt hashes still log in and are replaced with argon2 once argon2 is first"""
+        self.use_context(monkeypatch, ["bcrypt"])
+        self.register(client)
+
+        context = self.use_context(monkeypatch, ["argon2", "bcrypt"])
+        assert self.login(client).status_code == 200
+        new_hash = self.stored_hash(db_session)
+        assert new_hash.startswith("$argon2id$")
+        assert context.verify("rehashpassword", new_hash)
+
+    def test_login_with_dropped_scheme_is_rejected(self, client, monkeypatch):
+        """A hash from a scheme no longer configured fails the login instead of erroring"""
+        self.use_context(monkeypatch, ["argon2"])
+        self.register(client)
+
+        self.use_context(monkeypatch, ["bcrypt"])
+        assert self.login(client).status_code == 401
+
+    def test_calibration_fits_target(self):
+        """Calibration never goes below the minimum cost, and stays within a reachable target"""
+        assert auth.calibrate_bcrypt(0, samples=1)[0] == 4
+        rounds, seconds = auth.calibrate_bcrypt(0.05, samples=1)
+        assert rounds >= 4
+        assert rounds == 4 or seconds <= 0.05
+
 class TestUserEndpoints:
     def test_get_users_unauthorized(self, client):
         """Test getting users without authentication"""
@@ -231,6 +293,636 @@ class TestUserEndpoints:
         get_response = client.get("/users/1", headers=headers)
         assert get_response.status_code == 404
 
+class TestBatchUserLookup:
+    def create_users(self, client, headers, sample_user_data, ids):
+        """Create users with the given IDs from the sample data"""
+        for user_id in ids:
+            client.post("/users", json={
+                **sample_user_data,
+                "id": user_id,
+                "username": f"user{user_id}",
+                "email": f"user{user_id}@example.com"
+            }, headers=headers)
+
+    def test_get_users_by_ids(self, client, auth_token, sample_user_data):
+        """Test JSONPlaceholder style ?id= filtering"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        self.create_users(client, headers, sample_user_data, [1, 2, 3])
+
+        response = client.get("/users?id=3&id=1&id=42", headers=headers)
+        assert response.status_code == 200
+        assert [user["id"] for user in response.json()] == [3, 1]
+        assert response.headers["X-Missing-Ids"] == "42"
+
+    def test_mget_users(self, client, auth_token, sample_user_data):
+        """Test batch lookup reports order and missing IDs"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        self.create_users(client, headers, sample_user_data, [1, 2])
+
+        response = client.post("/users/_mget", json={"ids": [2, 99, 1, 2]}, headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert [user["id"] for user in data["users"]] == [2, 1]
+        assert data["missing"] == [99]
+
+    def test_mget_too_many_ids(self, client, auth_token):
+        """Test batch lookup rejects oversized requests"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = client.post("/users/_mget", json={"ids": list(range(501))}, headers=headers)
+        assert response.status_code == 400
+
+class TestSparseFieldsets:
+    def test_get_users_with_fields(self, client, auth_token, sample_user_data):
+        """Test that ?fields= returns only the requested fields"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post("/users", json=sample_user_data, headers=headers)
+
+        response = client.get("/users?fields=id,name,company.name,address.geo", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == [{
+            "id": 1,
+            "name": "Test User",
+            "company": {"name": "Test Company"},
+            "address": {"geo": {"lat": "40.7128", "lng": "-74.0060"}}
+        }]
+
+    def test_get_user_with_fields(self, client, auth_token, sample_user_data):
+        """Test sparse fieldsets on a single user"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post("/users", json=sample_user_data, headers=headers)
+
+        response = client.get("/users/1?fields=email,company,company.bs", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == {
+            "email": "test@example.com",
+            "company": sample_user_data["company"]
+        }
+
+    def test_get_users_unknown_field(self, client, auth_token):
+        """Test that unknown fields are rejected"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = client.get("/users?fields=id,password", headers=headers)
+        assert response.status_code == 400
+
+class TestUserChanges:
+    def test_changes_track_writes_and_deletes(self, client, auth_token, sample_user_data):
+        """Test that the change feed returns upserts and tombstones in version order"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        start = client.get("/users/changes", headers=headers).json()["next_since"]
+
+        client.post("/users", json=sample_user_data, headers=headers)
+        client.post("/users", json={
+            **sample_user_data, "id": 2, "username": "second", "email": "second@example.com"
+        }, headers=headers)
+        client.patch("/users/1", json={"name": "Renamed"}, headers=headers)
+        client.delete("/users/2", headers=headers)
+
+        response = client.get(f"/users/changes?since={start}", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        changes = [(change["id"], change["deleted"]) for change in data["changes"]]
+        assert changes == [(1, False), (2, True)]
+        assert data["changes"][0]["user"]["name"] == "Renamed"
+        assert data["has_more"] is False
+
+        # Nothing new after the returned version
+        response = client.get(f"/users/changes?since={data['next_since']}", headers=headers)
+        assert response.json()["changes"] == []
+
+    def test_changes_are_paged_by_version(self, client, auth_token, sample_user_data):
+        """Test paging through the change feed"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        start = client.get("/users/changes", headers=headers).json()["next_since"]
+        for user_id in (1, 2, 3):
+            client.post("/users", json={
+                **sample_user_data, "id": user_id,
+                "username": f"user{user_id}", "email": f"user{user_id}@example.com"
+            }, headers=headers)
+
+        first = client.get(f"/users/changes?since={start}&limit=2", headers=headers).json()
+        assert [change["id"] for change in first["changes"]] == [1, 2]
+        assert first["has_more"] is True
+
+        second = client.get(f"/users/changes?since={first['next_since']}&limit=2", headers=headers).json()
+        assert [change["id"] for change in second["changes"]] == [3]
+        assert second["has_more"] is False
+
+    def test_existing_users_table_is_migrated(self, tmp_path, sample_user_data):
+        """Test that a users table from before delta sync gets a version column and backfilled versions"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, "
+                "username VARCHAR(100) NOT NULL, email VARCHAR(255) NOT NULL, address JSON NOT NULL, "
+                "phone VARCHAR(50) NOT NULL, website VARCHAR(255) NOT NULL, company JSON NOT NULL)"
+            )
+            for user_id in (1, 2, 3):
+                connection.execute(
+                    text("INSERT INTO users VALUES (:id, :name, :username, :email, :address, :phone, :website, :company)"),
+                    {
+                        **sample_user_data, "id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+                        "address": json.dumps(sample_user_data["address"]), "company": json.dumps(sample_user_data["company"])
+                    }
+                )
+        Base.metadata.create_all(bind=engine)
+
+        changes.migrate_user_versions(engine)
+
+        # A migrated table needs no more DDL, which would lock users on every startup
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        changes.migrate_user_versions(engine)
+        event.remove(engine, "before_cursor_execute", listener)
+        assert not [statement for statement in statements if statement.lstrip().upper().startswith(("ALTER", "CREATE"))]
+
+        with Session(bind=engine) as db:
+            feed = changes.get_changes(db, 0, 10)
+            assert [change.id for change in feed.changes] == [1, 2, 3]
+            assert [change.version for change in feed.changes] == [1, 2, 3]
+            assert db.query(ChangeCounter.version).scalar() == 3
+        engine.dispose()
+
+class TestUserImports:
+    @pytest.fixture(autouse=True)
+    def import_dir(self, tmp_path, monkeypatch):
+        """Spool uploads into a temporary directory"""
+        monkeypatch.setattr(user_imports, "IMPORT_DIR", str(tmp_path))
+        return tmp_path
+
+    @pytest.fixture(autouse=True)
+    def deferred_submit(self, monkeypatch):
+        """Hold submitted jobs until the request has closed its session
+
+        Sessions share the test connection, so a worker's SAVEPOINTs must not
+        interleave with the request's.
+        """
+        submitted = []
+        monkeypatch.setattr(import_manager, "submit", lambda job_id, factory: submitted.append((job_id, factory)))
+        return submitted
+
+    def run_imports(self, submitted):
+        """Run the held jobs to completion"""
+        for job_id, factory in submitted:
+            ImportManager.submit(import_manager, job_id, factory)
+            import_manager.wait(job_id, timeout=10)
+
+    def user_rows(self, sample_user_data, ids):
+        """Sample users with the given IDs"""
+        return [{
+            **sample_user_data,
+            "id": user_id,
+            "username": f"import{user_id}",
+            "email": f"import{user_id}@example.com"
+        } for user_id in ids]
+
+    def test_import_ndjson(self, client, auth_token, sample_user_data, monkeypatch, deferred_submit):
+        """Test importing NDJSON in batches, reporting invalid rows"""
+        monkeypatch.setattr(import_manager, "batch_size", 2)
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        rows = self.user_rows(sample_user_data, [101, 102, 103]) + [{"id": 104}]
+        content = "\n".join(json.dumps(row) for row in rows)
+
+        response = client.post(
+            "/users/imports",
+            files={"file": ("users.ndjson", content, "application/x-ndjson")},
+            headers=headers
+        )
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        self.run_imports(deferred_submit)
+
+        data = client.get(f"/users/imports/{job_id}", headers=headers).json()
+        assert data["status"] == "completed"
+        assert data["rows_processed"] == 4
+        assert data["rows_imported"] == 3
+        assert data["rows_failed"] == 1
+        assert data["errors"][0]["row"] == 4
+        assert client.get("/users/103", headers=headers).status_code == 200
+
+    def test_import_csv(self, client, auth_token, deferred_submit):
+        """Test importing CSV with dotted nested columns"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        content = (
+            "id,name,username,email,phone,website,address.street,address.suite,address.city,"
+            "address.zipcode,address.geo.lat,address.geo.lng,company.name,company.catchPhrase,company.bs\n"
+            "201,CSV User,csvuser,csv@example.com,1,csv.com,St,1,City,1,0,0,Co,Phrase,Bs\n"
+        )
+        response = client.post("/users/imports", files={"file": ("users.csv", content, "text/csv")}, headers=headers)
+        self.run_imports(deferred_submit)
+
+        user = client.get("/users/201", headers=headers).json()
+        assert user["company"]["name"] == "Co"
+        assert user["address"]["geo"]["lat"] == "0"
+
+    def test_import_skips_unreadable_rows(self, client, auth_token, sample_user_data, deferred_submit):
+        """Test that rows that can't be parsed or decoded are reported and the rest still import"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        first, last = (json.dumps(row).encode() for row in self.user_rows(sample_user_data, [401, 402]))
+        ndjson = b"\n".join([first, b"{not json", b'{"name": "\xff"}', last])
+        csv_content = (
+            b"id,name,username,email,phone,website,address.street,address.suite,address.city,"
+            b"address.zipcode,address.geo.lat,address.geo.lng,company.name,company.catchPhrase,company.bs\n"
+            b"403,Bad \xff Byte,csvbad,csvbad@example.com,1,csv.com,St,1,City,1,0,0,Co,Phrase,Bs\n"
+            b"404,Extra,csvextra,csvextra@example.com,1,csv.com,St,1,City,1,0,0,Co,Phrase,Bs,Extra\n"
+            b"405,CSV User,csvuser,csv@example.com,1,csv.com,St,1,City,1,0,0,Co,Phrase,Bs\n"
+        )
+        job_ids = [
+            client.post("/users/imports", files={"file": (name, content, "text/plain")}, headers=headers).json()["id"]
+            for name, content in [("users.ndjson", ndjson), ("users.csv", csv_content)]
+        ]
+        self.run_imports(deferred_submit)
+
+        ndjson_job, csv_job = (client.get(f"/users/imports/{job_id}", headers=headers).json() for job_id in job_ids)
+        assert (ndjson_job["status"], ndjson_job["rows_imported"], ndjson_job["rows_failed"]) == ("completed", 2, 2)
+        assert [error["row"] for error in ndjson_job["errors"]] == [2, 3]
+        assert (csv_job["status"], csv_job["rows_imported"], csv_job["rows_failed"]) == ("completed", 1, 2)
+        assert [error["row"] for error in csv_job["errors"]] == [1, 2]
+        for user_id, status_code in [(401, 200), (402, 200), (403, 404), (404, 404), (405, 200)]:
+            assert client.get(f"/users/{user_id}", headers=headers).status_code == status_code
+
+    def test_failed_import_removes_upload(self, client, auth_token, deferred_submit, import_dir):
+        """Test that a file that can't be read at all fails the job and is not left on disk"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = client.post("/users/imports", files={"file": ("users.json", "[{", "application/json")}, headers=headers)
+        self.run_imports(deferred_submit)
+
+        data = client.get(f"/users/imports/{response.json()['id']}", headers=headers).json()
+        assert data["status"] == "failed"
+        assert list(import_dir.iterdir()) == []
+
+    def test_import_resumes_from_checkpoint(self, client, auth_token, sample_user_data, session_factory, deferred_submit):
+        """Test that an interrupted job skips rows before its checkpoint"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        rows = self.user_rows(sample_user_data, [301, 302])
+        db = session_factory()
+        job = import_manager.create_job(db, "users.json", "json", iter([json.dumps(rows).encode()]))
+        job_id = job.id
+        job.status = "running"
+        job.rows_processed = 1
+        db.commit()
+        db.close()
+
+        import_manager.resume(session_factory)
+        self.run_imports(deferred_submit)
+
+        data = client.get(f"/users/imports/{job_id}", headers=headers).json()
+        assert data["status"] == "completed"
+        assert data["rows_imported"] == 1
+        assert client.get("/users/301", headers=headers).status_code == 404
+        assert client.get("/users/302", headers=headers).status_code == 200
+
+    def test_import_unsupported_format(self, client, auth_token):
+        """Test that unknown file types are rejected"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = client.post("/users/imports", files={"file": ("users.xml", "<users/>", "text/xml")}, headers=headers)
+        assert response.status_code == 400
+
+class TestUserSnapshot:
+    @pytest.fixture(autouse=True)
+    def snapshot_mode(self, monkeypatch):
+        """Serve user reads from a fresh in-memory snapshot"""
+        monkeypatch.setattr(user_snapshot, "enabled", True)
+        monkeypatch.setattr(user_snapshot, "refresh_seconds", 60)
+        monkeypatch.setattr(user_snapshot, "snapshot", None)
+
+    def test_snapshot_serves_users(self, client, auth_token, sample_user_data):
+        """Test list, batch and single reads from the snapshot"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post("/users", json=sample_user_data, headers=headers)
+
+        response = client.get("/users", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == [sample_user_data]
+
+        response = client.get("/users?id=1&id=5", headers=headers)
+        assert [user["id"] for user in response.json()] == [1]
+        assert response.headers["X-Missing-Ids"] == "5"
+
+        assert client.get("/users/1", headers=headers).json() == sample_user_data
+        assert client.get("/users/5", headers=headers).status_code == 404
+
+    def test_snapshot_serves_mget(self, client, auth_token, sample_user_data):
+        """Test that batch lookups are answered from the snapshot"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        assert client.post("/users", json=sample_user_data, headers=headers).status_code == 201
+        second = {**sample_user_data, "id": 2, "username": "second", "email": "second@example.com"}
+        assert client.post("/users", json=second, headers=headers).status_code == 201
+
+        response = client.post("/users/_mget", json={"ids": [2, 99, 1, 2]}, headers=headers)
+        assert response.status_code == 200
+        assert [user["id"] for user in response.json()["users"]] == [2, 1]
+        assert response.json()["missing"] == [99]
+        assert user_snapshot.snapshot is not None
+
+    def test_snapshot_follows_writes(self, client, auth_token, sample_user_data):
+        """Test that committed writes are patched into the snapshot"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post("/users", json=sample_user_data, headers=headers)
+        client.get("/users/1", headers=headers)
+
+        client.patch("/users/1", json={"name": "Patched"}, headers=headers)
+        assert client.get("/users/1", headers=headers).json()["name"] == "Patched"
+
+        client.delete("/users/1", headers=headers)
+        assert client.get("/users/1", headers=headers).status_code == 404
+        assert client.get("/users", headers=headers).json() == []
+
+    def test_snapshot_ignores_lagging_replica(self, client, auth_token, sample_user_data, replica):
+        """Test that a read through a replica can't roll the snapshot back past a client's own write"""
+        writer = {"Authorization": f"Bearer {auth_token}"}
+        assert client.post("/users", json=sample_user_data, headers=writer).status_code == 201
+
+        reader_token = client.post("/auth/register", json={
+            "name": "Reader", "email": "reader@example.com", "password": "readerpassword"
+        }).json()["access_token"]
+        reader = {"Authorization": f"Bearer {reader_token}"}
+
+        # The reader is not pinned to the primary, so its read goes through the empty replica
+        assert client.get("/users/1", headers=reader).status_code == 200
+        assert client.get("/users/1", headers=writer).json() == sample_user_data
+
+    def test_snapshot_builds_in_background(self, client, auth_token, sample_user_data, session_factory, monkeypatch):
+        """Test that reads use the database until the background build finishes"""
+        monkeypatch.setattr(user_snapshot, "_building", threading.Event())
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post("/users", json=sample_user_data, headers=headers)
+
+        user_snapshot._building.set()
+        assert client.get("/users/1", headers=headers).json() == sample_user_data
+        assert user_snapshot.snapshot is None
+
+        user_snapshot._building.clear()
+        user_snapshot.start(session_factory)
+        for _ in range(100):
+            if not user_snapshot._building.is_set():
+                break
+            time.sleep(0.01)
+        assert user_snapshot.snapshot.get(1) is not None
+        assert client.get("/users", headers=headers).json() == [sample_user_data]
+
+class TestUserSuggest:
+    @pytest.fixture(autouse=True)
+    def fresh_index(self, monkeypatch):
+        """Build the prefix index from scratch for each test"""
+        monkeypatch.setattr(user_suggest, "enabled", True)
+        monkeypatch.setattr(user_suggest, "index", None)
+
+    def create_users(self, client, headers, sample_user_data):
+        for user_id, name, company in [(1, "Leanne Graham", "Romaguera-Crona"), (2, "Ervin Howell", "Deckow-Crist")]:
+            user = dict(sample_user_data, id=user_id, name=name, username=f"user{user_id}",
+                        email=f"user{user_id}@example.com", company=dict(sample_user_data["company"], name=company))
+            client.post("/users", json=user, headers=headers)
+
+    @pytest.mark.parametrize("index_enabled", [True, False])
+    def test_suggest_matches_prefixes(self, client, auth_token, sample_user_data, monkeypatch, index_enabled):
+        """Test prefix matches on names, words in names, usernames, emails and companies"""
+        monkeypatch.setattr(user_suggest, "enabled", index_enabled)
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        self.create_users(client, headers, sample_user_data)
+
+        def suggest(prefix, **params):
+            response = client.get("/users/suggest", params={"prefix": prefix, **params}, headers=headers)
+            assert response.status_code == 200
+            return [user["id"] for user in response.json()]
+
+        assert suggest("lea") == [1]
+        assert suggest("HOW") == [2]
+        assert sorted(suggest("user")) == [1, 2]
+        assert len(suggest("user", limit=1)) == 1
+        assert suggest("user2@") == [2]
+        assert suggest("deckow") == [2]
+        assert suggest("%") == []
+        assert client.get("/users/suggest", params={"prefix": "lea"}, headers=headers).json()[0] == {
+            "id": 1, "name": "Leanne Graham", "username": "user1",
+            "email": "user1@example.com", "company": "Romaguera-Crona"
+        }
+
+    def test_suggest_follows_writes(self, client, auth_token, sample_user_data):
+        """Test that created, renamed and deleted users are reflected in suggestions"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        self.create_users(client, headers, sample_user_data)
+        assert client.get("/users/suggest?prefix=leanne", headers=headers).json()[0]["id"] == 1
+
+        client.patch("/users/1", json={"name": "Clementine Bauch"}, headers=headers)
+        assert client.get("/users/suggest?prefix=leanne", headers=headers).json() == []
+        assert client.get("/users/suggest?prefix=bauch", headers=headers).json()[0]["id"] == 1
+
+        client.delete("/users/1", headers=headers)
+        assert client.get("/users/suggest?prefix=bauch", headers=headers).json() == []
+        assert [user["id"] for user in client.get("/users/suggest?prefix=user", headers=headers).json()] == [2]
+
+    def test_suggest_ignores_lagging_replica(self, client, auth_token, sample_user_data, replica, monkeypatch):
+        """Test that a search through a replica can't leave the index behind a client's own write"""
+        monkeypatch.setattr(user_suggest, "refresh_seconds", 60)
+        writer = {"Authorization": f"Bearer {auth_token}"}
+        self.create_users(client, writer, sample_user_data)
+
+        reader_token = client.post("/auth/register", json={
+            "name": "Reader", "email": "reader@example.com", "password": "readerpassword"
+        }).json()["access_token"]
+        reader = {"Authorization": f"Bearer {reader_token}"}
+
+        # The reader is not pinned to the primary, so its search goes through the empty replica
+        assert client.get("/users/suggest?prefix=leanne", headers=reader).json()[0]["id"] == 1
+        assert client.get("/users/suggest?prefix=ervin", headers=writer).json()[0]["id"] == 2
+
+        # The replica's older change counter never moves the index version back
+        version = user_suggest.index.version
+        with Session(bind=replica.engine) as db:
+            user_suggest._refresh(db)
+        assert user_suggest.index.version == version > 0
+
+    def test_suggest_uses_database_while_index_builds(self, client, auth_token, sample_user_data, session_factory, monkeypatch):
+        """Test that searches fall back to the database until the background build finishes"""
+        monkeypatch.setattr(user_suggest, "_building", threading.Event())
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        self.create_users(client, headers, sample_user_data)
+
+        user_suggest._building.set()
+        assert client.get("/users/suggest?prefix=leanne", headers=headers).json()[0]["id"] == 1
+        assert user_suggest.index is None
+
+        user_suggest._building.clear()
+        user_suggest.start(session_factory)
+        for _ in range(100):
+            if not user_suggest._building.is_set():
+                break
+            time.sleep(0.01)
+        assert user_suggest.index.search("ervin", 10)[0]["id"] == 2
+
+    def test_index_compacts_delta(self, monkeypatch):
+        """Test that searches see the same users before and after the delta is merged"""
+        monkeypatch.setattr(user_suggest_module, "COMPACT_ENTRIES", 20)
+        index = SuggestIndex.build(0, [(1, "Leanne Graham", "bret", "bret@example.com", "Romaguera-Crona")])
+        index.upsert(2, ("Ervin Howell", "antonette", "shanna@example.com", "Deckow-Crist"))
+        index.upsert(1, ("Leanne Bauch", "bret", "bret@example.com", "Romaguera-Crona"))
+        assert index.delta_keys and list(index.stale) == [1]
+        assert [user["id"] for user in index.search("leanne", 10)] == [1]
+        assert index.search("graham", 10) == []
+
+        index.remove(2)
+        for user_id in range(3, 6):
+            index.upsert(user_id, (f"User {user_id}", f"user{user_id}", f"user{user_id}@example.com", "Acme"))
+        assert not index.delta_keys and not index.stale
+        assert [user["id"] for user in index.search("user", 10)] == [3, 4, 5]
+        assert [user["id"] for user in index.search("bauch", 10)] == [1]
+        assert index.search("ervin", 10) == []
+
+class TestRequestCoalescing:
+    def test_identical_calls_share_one_fetch(self):
+        """Test that concurrent calls with the same key run the function once"""
+        flight = SingleFlight(enabled=True)
+        calls = []
+
+        def fetch():
+            calls.append(threading.get_ident())
+            time.sleep(0.05)
+            return b"users"
+
+        async def run():
+            return await asyncio.gather(*[flight.do("users", fetch) for _ in range(10)])
+
+        assert asyncio.run(run()) == [b"users"] * 10
+        assert len(calls) == 1
+        assert flight.stats()["saved"] == 9
+
+    def test_errors_reach_all_waiters(self):
+        """Test that a failing fetch raises in every caller"""
+        flight = SingleFlight(enabled=True)
+
+        def fetch():
+            time.sleep(0.05)
+            raise ValueError("boom")
+
+        async def run():
+            return await asyncio.gather(*[flight.do("users", fetch) for _ in range(3)], return_exceptions=True)
+
+        results = asyncio.run(run())
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight.stats()["errors"] == 1
+
+    def test_waiters_fall_back_after_timeout(self):
+        """Test that waiters stop waiting for a slow fetch and run their own"""
+        flight = SingleFlight(enabled=True, wait_seconds=0.01)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return len(calls)
+
+        async def run():
+            return await asyncio.gather(flight.do("users", fetch), flight.do("users", fetch))
+
+        asyncio.run(run())
+        assert len(calls) == 2
+        assert flight.stats()["timeouts"] == 1
+
+    def test_coalescing_stats_endpoint(self, client, auth_token):
+        """Test the admin counters endpoint"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.get("/users", headers=headers)
+        response = client.get("/admin/coalescing", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["leaders"] >= 1
+
+class TestSlowQueryLog:
+    @pytest.fixture(autouse=True)
+    def record_everything(self, monkeypatch):
+        """Treat every statement as slow"""
+        monkeypatch.setattr(slow_query_log, "threshold_ms", 0)
+        slow_query_log.reset()
+        yield
+        slow_query_log.reset()
+
+    def test_normalize_statement(self):
+        """Test that literals and IN lists are collapsed"""
+        statement = "SELECT * FROM users WHERE id IN (?, ?, ?)  AND name = 'x' LIMIT 10"
+        assert normalize_statement(statement) == "SELECT * FROM users WHERE id IN (?...) AND name = ? LIMIT ?"
+
+    def test_sequential_scans(self):
+        """Test seq scan detection for Postgres and SQLite plans"""
+        assert sequential_scans(["Seq Scan on users  (cost=0.00..1.10 rows=10)"]) == ["users"]
+        assert sequential_scans(["SCAN users"]) == ["users"]
+        assert sequential_scans(["SEARCH auth_users USING INDEX ix_auth_users_email (email=?)"]) == []
+
+    def test_slow_queries_report(self, client, auth_token):
+        """Test that slow statements are reported with plans and routes"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.get("/users?limit=5", headers=headers)
+        client.get("/users/17", headers=headers)
+        client.get("/users/18", headers=headers)
+
+        response = client.get("/admin/slow-queries", headers=headers)
+        assert response.status_code == 200
+        queries = response.json()["queries"]
+        users_query = next(
+            query for query in queries
+            if query["statement"].endswith("FROM users LIMIT ? OFFSET ?")
+        )
+        assert "GET /users" in users_query["routes"]
+        assert users_query["plan"]
+        assert users_query["sequential_scans"] == ["users"]
+        assert users_query["parameters"] == ["int", "int"]
+        # Routes are recorded by template, not by concrete path
+        routes = {route for query in queries for route in query["routes"]}
+        assert "GET /users/{user_id}" in routes
+        assert not any(route.startswith("GET /users/1") for route in routes)
+
+        assert client.delete("/admin/slow-queries", headers=headers).status_code == 204
+
+    def test_postgres_explain_runs_in_savepoint(self):
+        """Test that a failing EXPLAIN on Postgres is rolled back to a savepoint instead of aborting the transaction"""
+        executed = []
+
+        class Cursor:
+            def execute(self, statement, parameters=None):
+                executed.append(statement.split(" ")[0] if statement.startswith("EXPLAIN") else statement)
+                if statement.startswith("EXPLAIN"):
+                    raise RuntimeError("cannot explain")
+
+            def close(self):
+                pass
+
+        raw = SimpleNamespace(cursor=Cursor, dbapi_connection=SimpleNamespace(autocommit=False))
+        connection = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"), connection=raw)
+        with pytest.raises(RuntimeError):
+            slow_queries.explain(connection, "SELECT * FROM users", {})
+        assert executed == [
+            "SAVEPOINT slow_query_explain", "EXPLAIN",
+            "ROLLBACK TO SAVEPOINT slow_query_explain", "RELEASE SAVEPOINT slow_query_explain"
+        ]
+
+    def test_failed_statements_leave_no_timing_state(self, connection):
+        """Test that statements that raise keep nothing on the connection and don't disturb later timings"""
+        info = repr(connection.info)
+        for _ in range(3):
+            with pytest.raises(Exception):
+                connection.exec_driver_sql("SELECT * FROM no_such_table")
+        assert repr(connection.info) == info
+
+        connection.exec_driver_sql("SELECT count(*) FROM auth_users")
+        assert any(query["statement"] == "SELECT count(*) FROM auth_users" for query in slow_query_log.report())
+
+    def test_recurring_statement_climbs_into_report(self, monkeypatch):
+        """Test that a statement slow many times displaces one-off slow statements and is explained once"""
+        explained = []
+        monkeypatch.setattr(slow_queries, "explain", lambda connection, statement, parameters: explained.append(statement) or [])
+        log = SlowQueryLog(enabled=True, threshold_ms=0, top_n=3)
+
+        for table in ("a", "b", "c"):
+            log.record(None, f"SELECT * FROM {table}", (), False, 1000)
+        for _ in range(200):
+            log.record(None, "SELECT * FROM users WHERE id = ?", (1,), False, 150)
+
+        report = log.report()
+        assert len(report) == 3
+        assert report[0]["statement"] == "SELECT * FROM users WHERE id = ?"
+        assert report[0]["total_ms"] >= 200 * 150
+        assert report[0]["avg_ms"] == 150
+        assert len(explained) == 4
+
 class TestJSONPlaceholderCompatibility:
     def test_user_posts_endpoint(self, client, auth_token, sample_user_data, db_session):
         """Test JSONPlaceholder compatible posts endpoint"""
@@ -265,5 +957,139 @@ class TestJSONPlaceholderCompatibility:
         assert response.status_code == 200
         assert response.json() == []
 
+class TestReadReplicas:
+    def test_reads_served_by_replica(self, client, auth_token, sample_user_data, replica):
+        """Test that GET endpoints read from the replica"""
+        replica_db = replica.SessionLocal()
+        replica_db.add(User(**sample_user_data))
+        replica_db.commit()
+        replica_db.close()
+
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = client.get("/users/1", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["name"] == sample_user_data["name"]
+        assert client.get("/users/1/posts").status_code == 200
+        assert replica.in_flight == 0
+
+    def test_reads_follow_own_writes(self, client, auth_token, sample_user_data, replica):
+        """Test that a client reads from the primary right after its own write"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post("/users", json=sample_user_data, headers=headers)
+
+        # The writer sees its user, other clients still read the replica
+        assert client.get("/users/1", headers=headers).status_code == 200
+        assert client.get("/users/1/posts").status_code == 404
+
+    def test_unhealthy_replica_falls_back_to_primary(self, client, auth_token, replica):
+        """Test that reads go to the primary when the replica is down"""
+        replica.ping = lambda: False
+        replica.checked_at = 0.0
+
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = client.get("/users", headers=headers)
+        assert response.status_code == 200
+        assert replica.healthy is False
+
+    def test_replica_driver_errors_mark_it_unhealthy(self, client, auth_token, replica, monkeypatch):
+        """Test that any driver error while connecting takes the replica out of rotation"""
+        def connect():
+            raise InterfaceError("SELECT 1", {}, Exception("connection refused"))
+
+        monkeypatch.setattr(replica.engine, "connect", connect)
+        replica.checked_at = 0.0
+
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        assert client.get("/users", headers=headers).status_code == 200
+        assert replica.healthy is False
+
+class TestUserSharding:
+    def create_users(self, client, headers, sample_user_data, ids):
+        for user_id in ids:
+            user = dict(sample_user_data, id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com")
+            assert client.post("/users", json=user, headers=headers).status_code == 201
+
+    def test_users_are_routed_to_their_shard(self, client, auth_token, sample_user_data, shards, db_session):
+        """Test that writes land on the owning shard and point reads find them there"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        self.create_users(client, headers, sample_user_data, range(1, 31))
+
+        placement = shard_user_ids(shards)
+        assert all(placement.values())
+        assert sorted(sum(placement.values(), [])) == list(range(1, 31))
+        for name, ids in placement.items():
+            assert all(shards.ring.owner(user_id) == name for user_id in ids)
+        assert db_session.query(User).count() == 0
+
+        assert client.get("/users/7", headers=headers).json()["id"] == 7
+        client.patch("/users/7", json={"name": "Patched"}, headers=headers)
+        assert client.get("/users/7?fields=name", headers=headers).json() == {"name": "Patched"}
+        assert client.delete("/users/7", headers=headers).status_code == 204
+        assert client.get("/users/7", headers=headers).status_code == 404
+
+    def test_sharded_reads_bypass_replicas(self, client, auth_token, sample_user_data, shards, replica, monkeypatch):
+        """Test that user reads go to the shards without acquiring a replica"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        self.create_users(client, headers, sample_user_data, range(1, 4))
+
+        acquired = []
+        acquire = database.replica_set.acquire
+        monkeypatch.setattr(database.replica_set, "acquire", lambda client: acquired.append(client) or acquire(client))
+        assert client.get("/users/2", headers=headers).json()["id"] == 2
+        assert client.get("/users/2/posts", headers=headers).status_code == 200
+        assert [user["id"] for user in client.get("/users", headers=headers).json()] == [1, 2, 3]
+        assert client.post("/users/_mget", json={"ids": [3, 1]}, headers=headers).json()["missing"] == []
+        assert client.get("/users/count", headers=headers).status_code == 200
+        assert acquired == []
+
+    def test_lists_fan_out_and_merge_by_id(self, client, auth_token, sample_user_data, shards):
+        """Test pages, id filters, batches, counts and suggestions across shards"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        self.create_users(client, headers, sample_user_data, range(1, 31))
+
+        response = client.get("/users?skip=5&limit=10", headers=headers)
+        assert [user["id"] for user in response.json()] == list(range(6, 16))
+
+        response = client.get("/users?id=12&id=3&id=99", headers=headers)
+        assert [user["id"] for user in response.json()] == [12, 3]
+        assert response.headers["X-Missing-Ids"] == "99"
+
+        response = client.post("/users/_mget", json={"ids": [30, 1, 31]}, headers=headers)
+        assert [user["id"] for user in response.json()["users"]] == [30, 1]
+
+        assert client.get("/users/count", headers=headers).json() == {"count": 30}
+        response = client.get("/users/suggest?prefix=user2&limit=5", headers=headers)
+        assert sorted(user["id"] for user in response.json()) == [2, 20, 21, 22, 23]
+
+        assert client.get("/users/changes", headers=headers).status_code == 501
+
+    def test_hash_ring_moves_few_ids(self):
+        """Test that adding a shard only moves ids onto the new shard"""
+        before = HashRing(["shard0", "shard1", "shard2"])
+        after = HashRing(["shard0", "shard1", "shard2", "shard3"])
+        moved = [user_id for user_id in range(10000) if before.owner(user_id) != after.owner(user_id)]
+        assert all(after.owner(user_id) == "shard3" for user_id in moved)
+        assert 0.15 < len(moved) / 10000 < 0.35
+
+    def test_rebalance_moves_users_to_new_shard(self, shards, sample_user_data, tmp_path):
+        """Test that rebalancing after adding a shard leaves every user on its owner"""
+        shards.add_all([
+            User(**dict(sample_user_data, id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com"))
+            for user_id in range(1, 101)
+        ])
+        urls = {name: shard.url for name, shard in shards.shards.items()}
+        grown = UserShards(dict(urls, shard3=f"sqlite:///{tmp_path / 'shard3.db'}"))
+        grown.create_all()
+
+        planned = rebalance(grown, batch_size=10, dry_run=True)
+        assert sum(count for targets in planned.values() for count in targets.values()) > 0
+        moves = rebalance(grown, batch_size=10)
+        assert set(target for targets in moves.values() for target in targets) == {"shard3"}
+        placement = shard_user_ids(grown)
+        assert sorted(sum(placement.values(), [])) == list(range(1, 101))
+        for name, ids in placement.items():
+            assert all(grown.ring.owner(user_id) == name for user_id in ids)
+        assert rebalance(grown) == {}
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,264 @@
+import csv
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import ImportJob, User
+from schemas import UserCreate, ImportJobResponse
+
+# Import configuration
+IMPORT_DIR = os.getenv("IMPORT_DIR", "imports")
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Only the first errors are kept on the job, the rest are just counted
+MAX_IMPORT_ERRORS = 100
+
+IMPORT_FORMATS = {
+    ".json": "json",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".csv": "csv",
+}
+
+def detect_format(filename: str) -> Optional[str]:
+    """Guess the import format from the uploaded file name"""
+    return IMPORT_FORMATS.get(os.path.splitext(filename or "")[1].lower())
+
+def _unflatten(row: Dict[str, str]) -> dict:
+    """Turn CSV columns like company.name into nested objects"""
+    result = {}
+    for key, value in row.items():
+        target = result
+        parts = key.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return result
+
+class RowError(Exception):
+    """A row that could not be read; it is recorded on the job and the import carries on"""
+
+def _is_utf8(value) -> bool:
+    """Whether a value read with surrogateescape decoded cleanly"""
+    try:
+        value.encode("utf-8")
+        return True
+    except UnicodeEncodeError:
+        return False
+
+def iter_rows(path: str, format: str) -> Iterator[Union[dict, RowError]]:
+    """Yield user dicts from a spooled import file, or a RowError for each row that can't be read.
+
+    Rows keep their position either way, so checkpoints stay valid on resume.
+    """
+    if format == "json":
+        # JSON arrays are loaded whole, so a syntax error fails the job; use NDJSON for very large imports
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f)
+    elif format == "ndjson":
+        # Decode line by line, so a bad line only costs that row
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line.decode("utf-8"))
+                    except ValueError as e:
+                        yield RowError(f"Invalid JSON: {e}")
+    elif format == "csv":
+        # surrogateescape keeps invalid bytes from breaking the rows around them
+        with open(path, newline="", encoding="utf-8", errors="surrogateescape") as f:
+            reader = csv.DictReader(f)
+            while True:
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    return
+                except csv.Error as e:
+                    yield RowError(f"Invalid CSV: {e}")
+                    continue
+                if None in row:
+                    yield RowError("Row has more fields than the header")
+                elif not all(value is None or _is_utf8(value) for value in row.values()):
+                    yield RowError("Row is not valid UTF-8")
+                else:
+                    yield _unflatten(row)
+    else:
+        raise ValueError(f"Unsupported import format: {format}")
+
+def job_response(job: ImportJob) -> ImportJobResponse:
+    """Build the status response for a job, including its import rate"""
+    response = ImportJobResponse.model_validate(job)
+    if job.started_at is not None:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+        if elapsed > 0:
+            response.rows_per_second = round((job.rows_processed - job.resumed_from) / elapsed, 1)
+    return response
+
+class ImportManager:
+    """Runs user imports on a local worker pool, checkpointing after every batch"""
+
+    def __init__(self, workers: int = IMPORT_WORKERS, batch_size: int = IMPORT_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: Dict[str, Future] = {}
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def create_job(self, db: Session, filename: str, format: str, chunks: Iterator[bytes]) -> ImportJob:
+        """Spool an upload to disk and record a queued job for it"""
+        os.makedirs(IMPORT_DIR, exist_ok=True)
+        job_id = str(uuid.uuid4())
+        path = os.path.join(IMPORT_DIR, f"{job_id}.{format}")
+        with open(path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+        job = ImportJob(
+            id=job_id,
+            filename=filename,
+            path=path,
+            format=format,
+            status="queued",
+            errors=[],
+            created_at=datetime.utcnow()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def submit(self, job_id: str, session_factory=SessionLocal):
+        """Queue a job on the worker pool"""
+        with self._lock:
+            if self._executor is None:
+                self._stopping.clear()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="user-import")
+            self._futures[job_id] = self._executor.submit(self._run, job_id, session_factory)
+
+    def resume(self, session_factory=SessionLocal):
+        """Re-queue jobs that were queued or running when the process stopped"""
+        db = session_factory()
+        try:
+            job_ids = [
+                job_id for (job_id,) in
+                db.query(ImportJob.id).filter(ImportJob.status.in_(["queued", "running"])).all()
+            ]
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self.submit(job_id, session_factory)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None):
+        """Block until a submitted job finishes"""
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def shutdown(self):
+        """Stop after the current batches; unfinished jobs resume on next start"""
+        self._stopping.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _run(self, job_id: str, session_factory):
+        """Import a job's rows, skipping those already covered by its checkpoint"""
+        db = session_factory()
+        try:
+            job = db.get(ImportJob, job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            job.finished_at = None
+            job.resumed_from = job.rows_processed
+            db.commit()
+
+            batch: List[Tuple[int, Union[dict, RowError]]] = []
+            for index, row in enumerate(iter_rows(job.path, job.format)):
+                if index < job.resumed_from:
+                    continue
+                batch.append((index, row))
+                if len(batch) >= self.batch_size:
+                    self._import_batch(db, job, batch)
+                    batch = []
+                    if self._stopping.is_set():
+                        job.status = "queued"
+                        db.commit()
+                        return
+            if batch:
+                self._import_batch(db, job, batch)
+
+            job.status = "completed"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            os.remove(job.path)
+        except Exception as e:
+            db.rollback()
+            job = db.get(ImportJob, job_id)
+            if job is not None:
+                job.status = "failed"
+                job.finished_at = datetime.utcnow()
+                job.errors = (job.errors + [{"row": None, "error": str(e)}])[:MAX_IMPORT_ERRORS]
+                db.commit()
+                # Failed jobs are never resumed, so their upload is no longer needed
+                try:
+                    os.remove(job.path)
+                except OSError:
+                    pass
+        finally:
+            db.close()
+
+    def _import_batch(self, db: Session, job: ImportJob, batch: List[Tuple[int, Union[dict, RowError]]]):
+        """Insert one batch and advance the checkpoint in the same transaction"""
+        valid, errors = [], []
+        for index, row in batch:
+            if isinstance(row, RowError):
+                errors.append({"row": index + 1, "error": str(row)})
+                continue
+            try:
+                valid.append((index, UserCreate(**row).dict()))
+            except (ValidationError, TypeError) as e:
+                errors.append({"row": index + 1, "error": str(e)})
+
+        try:
+            db.add_all([User(**data) for _, data in valid])
+            self._checkpoint(job, batch[-1][0] + 1, len(valid), errors)
+            db.commit()
+            return
+        except IntegrityError:
+            db.rollback()
+
+        # Some row conflicts with existing data, fall back to row-by-row inserts
+        for index, data in valid:
+            try:
+                db.add(User(**data))
+                self._checkpoint(job, index + 1, 1, [])
+                db.commit()
+            except IntegrityError as e:
+                db.rollback()
+                errors.append({"row": index + 1, "error": str(e.orig)})
+        self._checkpoint(job, batch[-1][0] + 1, 0, errors)
+        db.commit()
+
+    def _checkpoint(self, job: ImportJob, rows_processed: int, imported: int, errors: List[dict]):
+        """Record progress on the job row"""
+        job.rows_processed = rows_processed
+        job.rows_imported += imported
+        job.rows_failed += len(errors)
+        if errors and len(job.errors) < MAX_IMPORT_ERRORS:
+            job.errors = (job.errors + errors)[:MAX_IMPORT_ERRORS]
+
+import_manager = ImportManager()
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from models import User, UserTombstone, ChangeCounter
+from changes import user_commit_hooks
+
+logger = logging.getLogger(__name__)
+
+# Snapshot configuration
+USER_SNAPSHOT_ENABLED = os.getenv("USER_SNAPSHOT_ENABLED", "false").lower() in ("1", "true", "yes")
+USER_SNAPSHOT_REFRESH_SECONDS = float(os.getenv("USER_SNAPSHOT_REFRESH_SECONDS", "1"))
+
+# Rows streamed per round trip when building a snapshot
+BUILD_BATCH_SIZE = 10000
+
+# Plain column rows are much cheaper to load than ORM instances
+SNAPSHOT_COLUMNS = (
+    User.name, User.username, User.email, User.address,
+    User.phone, User.website, User.company, User.id
+)
+
+def encode_user(user: User) -> bytes:
+    """Pre-encode a user exactly as UserResponse would serialise it"""
+    return json.dumps({
+        "name": user.name,
+        "username": user.username,
+        "email": user.email,
+        "address": user.address,
+        "phone": user.phone,
+        "website": user.website,
+        "company": user.company,
+        "id": user.id,
+    }, separators=(",", ":")).encode()
+
+class UserSnapshot:
+    """Immutable view of all users: sorted ids, their encoded rows and an id index"""
+    __slots__ = ("version", "ids", "payloads", "index")
+
+    def __init__(self, version: int, ids: array, payloads: List[bytes]):
+        self.version = version
+        self.ids = ids
+        self.payloads = payloads
+        self.index: Dict[int, int] = {user_id: position for position, user_id in enumerate(ids)}
+
+    @classmethod
+    def build(cls, version: int, users: Iterable[User]) -> "UserSnapshot":
+        """Encode every user, ordered by id"""
+        ids, payloads = array("q"), []
+        for user in users:
+            ids.append(user.id)
+            payloads.append(encode_user(user))
+        return cls(version, ids, payloads)
+
+    def get(self, user_id: int) -> Optional[bytes]:
+        """Encoded user by id"""
+        position = self.index.get(user_id)
+        return None if position is None else self.payloads[position]
+
+    def page(self, skip: int, limit: int) -> bytes:
+        """Encoded JSON array of a page of users"""
+        return b"[" + b",".join(self.payloads[max(skip, 0):max(skip, 0) + max(limit, 0)]) + b"]"
+
+    def patched(self, version: int, users: List[User], deleted: List[int]) -> "UserSnapshot":
+        """New snapshot with changed users re-encoded and deleted users dropped"""
+        deleted = [user_id for user_id in deleted if user_id in self.index]
+        if not deleted and all(user.id in self.index for user in users):
+            # Updates only: copy the row list and swap the changed entries
+            payloads = list(self.payloads)
+            for user in users:
+                payloads[self.index[user.id]] = encode_user(user)
+            snapshot = UserSnapshot.__new__(UserSnapshot)
+            snapshot.version, snapshot.ids, snapshot.payloads, snapshot.index = (
+                version, self.ids, payloads, self.index
+            )
+            return snapshot
+
+        rows = dict(zip(self.ids, self.payloads))
+        for user_id in deleted:
+            del rows[user_id]
+        for user in users:
+            rows[user.id] = encode_user(user)
+        ids = array("q", sorted(rows))
+        return UserSnapshot(version, ids, [rows[user_id] for user_id in ids])
+
+class UserSnapshotStore:
+    """Holds the current snapshot and keeps it in step with the change counter"""
+
+    def __init__(self, enabled: bool = USER_SNAPSHOT_ENABLED, refresh_seconds: float = USER_SNAPSHOT_REFRESH_SECONDS):
+        self.enabled = enabled
+        self.refresh_seconds = refresh_seconds
+        self.snapshot: Optional[UserSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._building = threading.Event()
+
+    def invalidate(self):
+        """Check the change counter on the next read"""
+        self._checked_at = 0.0
+
+    def start(self, session_factory: sessionmaker):
+        """Build the first snapshot in a background thread; reads use the database until it is ready"""
+        if not self.enabled or self.snapshot is not None or self._building.is_set():
+            return
+        self._building.set()
+        threading.Thread(
+            target=self._build_in_background, args=(session_factory,), name="user-snapshot-build", daemon=True
+        ).start()
+
+    def _build_in_background(self, session_factory: sessionmaker):
+        db = session_factory()
+        try:
+            with self._lock:
+                if self.snapshot is None:
+                    started = time.monotonic()
+                    self.snapshot = self._refresh(db, None)
+                    self._checked_at = started
+        except Exception:
+            # The next read builds it instead
+            logger.exception("Building the user snapshot failed")
+        finally:
+            db.close()
+            self._building.clear()
+
+    def current(self, session_factory: sessionmaker) -> Optional[UserSnapshot]:
+        """Current snapshot, refreshed at most every refresh_seconds; None while the first build runs.
+
+        Refreshes read the primary through session_factory, never a replica, so a
+        lagging replica can't roll the snapshot back past a client's own writes.
+        Blocks on database queries, so call it from a worker thread.
+        """
+        if self.snapshot is None and self._building.is_set():
+            return None
+        if self.snapshot is None or time.monotonic() - self._checked_at >= self.refresh_seconds:
+            with self._lock:
+                now = time.monotonic()
+                if self.snapshot is None or now - self._checked_at >= self.refresh_seconds:
+                    db = session_factory()
+                    try:
+                        self.snapshot = self._refresh(db, self.snapshot)
+                    finally:
+                        db.close()
+                    self._checked_at = now
+        return self.snapshot
+
+    def _refresh(self, db: Session, snapshot: Optional[UserSnapshot]) -> UserSnapshot:
+        """Build a snapshot, or patch it with changes made since its version"""
+        version = db.query(ChangeCounter.version).filter(ChangeCounter.id == 1).scalar() or 0
+        if snapshot is None:
+            users = db.query(*SNAPSHOT_COLUMNS).order_by(User.id).yield_per(BUILD_BATCH_SIZE)
+            return UserSnapshot.build(version, users)
+        if version == snapshot.version:
+            return snapshot
+
+        users = db.query(*SNAPSHOT_COLUMNS).filter(User.version > snapshot.version).all()
+        deleted = [
+            user_id for (user_id,) in
+            db.query(UserTombstone.id).filter(UserTombstone.version > snapshot.version).all()
+        ]
+        return snapshot.patched(version, users, deleted)
+
+user_snapshot = UserSnapshotStore()
+
+# Pick up users written by this process on the next read
+user_commit_hooks.append(user_snapshot.invalidate)
@@ -0,0 +1,298 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, inspect, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from models import User, UserTombstone, ChangeCounter
+from changes import user_commit_hooks
+
+logger = logging.getLogger(__name__)
+
+# Suggest configuration; the index costs roughly 780 MiB per million users in every worker
+USER_SUGGEST_INDEX_ENABLED = os.getenv("USER_SUGGEST_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+USER_SUGGEST_REFRESH_SECONDS = float(os.getenv("USER_SUGGEST_REFRESH_SECONDS", "1"))
+
+# Rows streamed per round trip when building the index
+BUILD_BATCH_SIZE = 10000
+
+# Pending delta entries and stale users that trigger a merge into the main arrays
+COMPACT_ENTRIES = 50000
+
+COMPANY_NAME = User.company["name"].as_string()
+SUGGEST_COLUMNS = (User.id, User.name, User.username, User.email, COMPANY_NAME)
+
+# (name, username, email, company name)
+Suggestion = Tuple[str, str, str, str]
+
+def suggestion_keys(suggestion: Suggestion) -> List[str]:
+    """Lowercased index keys: username and email whole, name and company from each word on"""
+    name, username, email, company = suggestion
+    keys = [username.lower(), email.lower()]
+    for value in (name, company):
+        words = value.lower().split()
+        keys += [" ".join(words[start:]) for start in range(len(words))]
+    # One entry per distinct key keeps removal exact
+    return list(dict.fromkeys(keys))
+
+def normalize_prefix(prefix: str) -> str:
+    """Lowercase and collapse whitespace, keeping a trailing space as a word boundary"""
+    words = prefix.lower().split()
+    return " ".join(words) + (" " if words and prefix[-1].isspace() else "")
+
+def suggestion_response(user_id: int, suggestion: Suggestion) -> dict:
+    """Suggestion in UserSuggestion shape"""
+    name, username, email, company = suggestion
+    return {"id": user_id, "name": name, "username": username, "email": email, "company": company}
+
+def entry_position(keys, ids, key: str, user_id: int) -> int:
+    """Where (key, user_id) is or would go in parallel arrays sorted by key, then id"""
+    low = bisect_left(keys, key)
+    high = bisect_right(keys, key, low)
+    return bisect_left(ids, user_id, low, high)
+
+class SuggestIndex:
+    """Parallel arrays of (key, user id) sorted by key then id, searched by bisecting on a prefix.
+
+    Writes go to a small sorted delta and mark the user's main entries stale, so an
+    update never shifts the large arrays; the delta is merged in once it grows.
+    """
+    __slots__ = ("version", "keys", "ids", "users", "delta_keys", "delta_ids", "stale")
+
+    def __init__(self, version: int = 0):
+        self.version = version
+        self.keys: List[str] = []
+        self.ids = array("q")
+        self.users: Dict[int, Suggestion] = {}
+        self.delta_keys: List[str] = []
+        self.delta_ids: List[int] = []
+        # Users whose main entries are out of date, with the suggestion they were built from
+        self.stale: Dict[int, Suggestion] = {}
+
+    @classmethod
+    def build(cls, version: int, rows: Iterable[tuple]) -> "SuggestIndex":
+        """Index (id, name, username, email, company name) rows, given in id order, in one sort"""
+        index = cls(version)
+        keys, ids = [], []
+        for user_id, *suggestion in rows:
+            suggestion = tuple(value or "" for value in suggestion)
+            index.users[user_id] = suggestion
+            user_keys = suggestion_keys(suggestion)
+            keys += user_keys
+            ids += [user_id] * len(user_keys)
+
+        # Sorting positions compares strings only, much cheaper than (key, id) tuples;
+        # the sort is stable so ids stay ascending within a key
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        index.keys = list(map(keys.__getitem__, order))
+        index.ids = array("q", map(ids.__getitem__, order))
+        return index
+
+    def _matches(self, keys, ids, prefix: str, skip):
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix):
+            if ids[position] not in skip:
+                yield keys[position], ids[position]
+            position += 1
+
+    def search(self, prefix: str, limit: int) -> List[dict]:
+        """Up to `limit` distinct users with a key starting with `prefix`, in key order"""
+        prefix = normalize_prefix(prefix)
+        found: Dict[int, None] = {}
+        for _, user_id in heapq.merge(
+            self._matches(self.keys, self.ids, prefix, self.stale),
+            self._matches(self.delta_keys, self.delta_ids, prefix, ()),
+        ):
+            found[user_id] = None
+            if len(found) == limit:
+                break
+        return [suggestion_response(user_id, self.users[user_id]) for user_id in found]
+
+    def upsert(self, user_id: int, suggestion: Suggestion):
+        """Insert or replace a user's keys"""
+        self.remove(user_id)
+        self.users[user_id] = suggestion
+        for key in suggestion_keys(suggestion):
+            position = entry_position(self.delta_keys, self.delta_ids, key, user_id)
+            self.delta_keys.insert(position, key)
+            self.delta_ids.insert(position, user_id)
+        self._maybe_compact()
+
+    def remove(self, user_id: int):
+        """Drop a user's keys"""
+        suggestion = self.users.pop(user_id, None)
+        if suggestion is None:
+            return
+        in_delta = False
+        for key in suggestion_keys(suggestion):
+            position = entry_position(self.delta_keys, self.delta_ids, key, user_id)
+            if position < len(self.delta_keys) and self.delta_ids[position] == user_id and self.delta_keys[position] == key:
+                del self.delta_keys[position]
+                del self.delta_ids[position]
+                in_delta = True
+        if not in_delta:
+            self.stale[user_id] = suggestion
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        """Compact once the delta is large enough to slow searches"""
+        if len(self.delta_keys) + len(self.stale) >= COMPACT_ENTRIES:
+            self.compact()
+
+    def compact(self):
+        """Merge the delta into the main arrays and drop stale entries"""
+        # (main position, 0 = insert before it / 1 = drop it, delta order, key, id)
+        edits = []
+        for user_id, suggestion in self.stale.items():
+            for key in suggestion_keys(suggestion):
+                edits.append((entry_position(self.keys, self.ids, key, user_id), 1, 0, None, None))
+        for order, (key, user_id) in enumerate(zip(self.delta_keys, self.delta_ids)):
+            edits.append((entry_position(self.keys, self.ids, key, user_id), 0, order, key, user_id))
+        edits.sort()
+
+        # Copy the untouched runs between edits as slices
+        keys, ids, start = [], array("q"), 0
+        for position, drop, _, key, user_id in edits:
+            keys += self.keys[start:position]
+            ids += self.ids[start:position]
+            start = position
+            if drop:
+                start += 1
+            else:
+                keys.append(key)
+                ids.append(user_id)
+        keys += self.keys[start:]
+        ids += self.ids[start:]
+
+        self.keys, self.ids = keys, ids
+        self.delta_keys, self.delta_ids, self.stale = [], [], {}
+
+class UserSuggestStore:
+    """Holds the prefix index and patches it with changes from the change counter"""
+
+    def __init__(self, enabled: bool = USER_SUGGEST_INDEX_ENABLED, refresh_seconds: float = USER_SUGGEST_REFRESH_SECONDS):
+        self.enabled = enabled
+        self.refresh_seconds = refresh_seconds
+        self.index: Optional[SuggestIndex] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._building = threading.Event()
+
+    def invalidate(self):
+        """Check the change counter on the next search"""
+        self._checked_at = 0.0
+
+    def start(self, session_factory: sessionmaker):
+        """Build the index in a background thread; searches use the database until it is ready"""
+        if not self.enabled or self.index is not None or self._building.is_set():
+            return
+        self._building.set()
+        threading.Thread(
+            target=self._build_in_background, args=(session_factory,), name="user-suggest-build", daemon=True
+        ).start()
+
+    def _build_in_background(self, session_factory: sessionmaker):
+        db = session_factory()
+        try:
+            with self._lock:
+                if self.index is None:
+                    started = time.monotonic()
+                    self._refresh(db)
+                    self._checked_at = started
+        except Exception:
+            # The next search builds it instead
+            logger.exception("Building the suggest index failed")
+        finally:
+            db.close()
+            self._building.clear()
+
+    def search(self, session_factory: sessionmaker, prefix: str, limit: int) -> Optional[List[dict]]:
+        """Search the index, bringing it up to date at most every refresh_seconds; None while it is first built.
+
+        Refreshes read the primary through session_factory, never a replica, so a
+        lagging replica can't hide a client's own writes from the index.
+        Blocks on database queries, so call it from a worker thread.
+        """
+        if self.index is None and self._building.is_set():
+            return None
+        with self._lock:
+            now = time.monotonic()
+            if self.index is None or now - self._checked_at >= self.refresh_seconds:
+                db = session_factory()
+                try:
+                    self._refresh(db)
+                finally:
+                    db.close()
+                self._checked_at = now
+            return self.index.search(prefix, limit)
+
+    def _refresh(self, db: Session):
+        """Build the index, or apply users written since its version"""
+        version = db.query(ChangeCounter.version).filter(ChangeCounter.id == 1).scalar() or 0
+        if self.index is None:
+            rows = db.query(*SUGGEST_COLUMNS).order_by(User.id).yield_per(BUILD_BATCH_SIZE)
+            self.index = SuggestIndex.build(version, rows)
+            return
+        # Never move the index back to an older version
+        if version <= self.index.version:
+            return
+
+        since = self.index.version
+        for user_id, *suggestion in db.query(*SUGGEST_COLUMNS).filter(User.version > since):
+            self.index.upsert(user_id, tuple(value or "" for value in suggestion))
+        for (user_id,) in db.query(UserTombstone.id).filter(UserTombstone.version > since):
+            self.index.remove(user_id)
+        self.index.version = version
+
+def escape_like(value: str) -> str:
+    """Match LIKE wildcards in user input literally"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def suggest_from_database(db: Session, prefix: str, limit: int) -> List[dict]:
+    """Same prefix match as the index, answered by the database in name order"""
+    prefix = escape_like(normalize_prefix(prefix))
+    conditions = []
+    for column in (User.username, User.email):
+        conditions.append(func.lower(column).like(f"{prefix}%", escape="\\"))
+    for column in (User.name, COMPANY_NAME):
+        conditions.append(func.lower(column).like(f"{prefix}%", escape="\\"))
+        conditions.append(func.lower(column).like(f"% {prefix}%", escape="\\"))
+
+    rows = db.query(*SUGGEST_COLUMNS).filter(or_(*conditions)).order_by(User.name, User.id).limit(limit)
+    return [suggestion_response(user_id, tuple(suggestion)) for user_id, *suggestion in rows]
+
+# Trigram indexes let Postgres answer the fallback's LIKE patterns without a scan
+SUGGEST_INDEXES = {
+    "ix_users_name_trgm": "lower(name)",
+    "ix_users_username_trgm": "lower(username)",
+    "ix_users_email_trgm": "lower(email)",
+    "ix_users_company_name_trgm": "lower(company->>'name')",
+}
+
+def create_suggest_indexes(engine: Engine):
+    """Add the trigram indexes to a users table on PostgreSQL, including tables created before them"""
+    if engine.dialect.name != "postgresql":
+        return
+    # CREATE INDEX locks users even when the index exists, so only run what is missing
+    existing = {index["name"] for index in inspect(engine).get_indexes(User.__tablename__)}
+    missing = [name for name in SUGGEST_INDEXES if name not in existing]
+    if not missing:
+        return
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name in missing:
+            connection.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS {name} ON users USING gin ({SUGGEST_INDEXES[name]} gin_trgm_ops)"
+            )
+
+user_suggest = UserSuggestStore()
+
+# Pick up users written by this process on the next search
+user_commit_hooks.append(user_suggest.invalidate)
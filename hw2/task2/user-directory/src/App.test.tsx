@@ -2,8 +2,10 @@ import React from 'react';
 import { render, screen } from '@testing-library/react';
 import App from './App';
 
-test('renders learn react link', () => {
+test('shows the loading state while the first page is fetched', () => {
+  // Never resolves, so the test ends while the first page is still loading
+  global.fetch = jest.fn(() => new Promise<Response>(() => {}));
   render(<App />);
-  const linkElement = screen.getByText(/learn react/i);
-  expect(linkElement).toBeInTheDocument();
+  expect(screen.getByText(/loading users/i)).toBeInTheDocument();
+  expect(global.fetch).toHaveBeenCalledTimes(1);
 });
@@ -1,56 +1,39 @@
-import React, { useState, useEffect } from 'react';
+import React, { Profiler, useCallback, useState } from 'react';
 import './App.css';
 import UserTable from './components/UserTable';
 import UserModal from './components/UserModal';
 import { User } from './types/User';
 import { userService } from './services/userService';
+import { useUserPages } from './hooks/useUserPages';
+import { reportRenderTime } from './appMetrics';
 
 function App() {
-  const [users, setUsers] = useState<User[]>([]);
+  const { users, hasMore, loading, loadingMore, error, loadMore, reload, removeUser } = useUserPages();
   const [selectedUser, setSelectedUser] = useState<User | null>(null);
   const [isModalOpen, setIsModalOpen] = useState(false);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState<string | null>(null);
 
-  useEffect(() => {
-    fetchUsers();
-  }, []);
-
-  const fetchUsers = async () => {
-    try {
-      setLoading(true);
-      setError(null);
-      const userData = await userService.getUsers();
-      setUsers(userData);
-    } catch (err) {
-      setError('Failed to fetch users. Please try again later.');
-      console.error('Error fetching users:', err);
-    } finally {
-      setLoading(false);
-    }
-  };
-
-  const handleUserClick = (user: User) => {
+  // Stable callbacks keep memoised table rows from re-rendering
+  const handleUserClick = useCallback((user: User) => {
     setSelectedUser(user);
     setIsModalOpen(true);
-  };
+  }, []);
 
   const handleCloseModal = () => {
     setIsModalOpen(false);
     setSelectedUser(null);
   };
 
-  const handleDeleteUser = async (userId: number) => {
+  const handleDeleteUser = useCallback(async (userId: number) => {
     try {
       await userService.deleteUser(userId);
-      setUsers(users.filter(user => user.id !== userId));
+      removeUser(userId, true);
     } catch (err) {
       console.error('Error deleting user:', err);
       // Note: Since this is client-side only as per requirements, 
       // we still remove from local state even if API call fails
-      setUsers(users.filter(user => user.id !== userId));
+      removeUser(userId, false);
     }
-  };
+  }, [removeUser]);
 
   if (loading) {
     return (
@@ -63,13 +46,13 @@ function App() {
     );
   }
 
-  if (error) {
+  if (error && users.length === 0) {
     return (
       <div className="app">
         <div className="error-container">
           <h2>Error</h2>
           <p>{error}</p>
-          <button onClick={fetchUsers} className="retry-button">
+          <button onClick={reload} className="retry-button">
             Try Again
           </button>
         </div>
@@ -85,11 +68,17 @@ function App() {
       </header>
       
       <main className="app-main">
-        <UserTable 
-          users={users}
-          onUserClick={handleUserClick}
-          onDeleteUser={handleDeleteUser}
-        />
+        <Profiler id="UserTable" onRender={reportRenderTime}>
+          <UserTable
+            users={users}
+            hasMore={hasMore}
+            loadingMore={loadingMore}
+            error={error}
+            onLoadMore={loadMore}
+            onUserClick={handleUserClick}
+            onDeleteUser={handleDeleteUser}
+          />
+        </Profiler>
       </main>
 
       <UserModal
@@ -0,0 +1,31 @@
+// The app's own performance metrics, reported separately from web vitals
+// because their names are not web-vitals metric names
+export interface AppMetric {
+  name: string;
+  value: number;
+}
+
+export type AppMetricHandler = (metric: AppMetric) => void;
+
+let metricHandler: AppMetricHandler | undefined;
+let lastMemorySample = 0;
+
+const reportAppMetrics = (onMetric?: AppMetricHandler) => {
+  metricHandler = onMetric;
+};
+
+// Report a React <Profiler> commit, plus JS heap usage at most once a second
+export const reportRenderTime = (id: string, phase: string, actualDuration: number) => {
+  if (!metricHandler) return;
+  metricHandler({ name: `render:${id}:${phase}`, value: actualDuration });
+
+  // performance.memory is only available in Chromium browsers
+  const memory = (performance as Performance & { memory?: { usedJSHeapSize: number } }).memory;
+  const now = Date.now();
+  if (memory && now - lastMemorySample >= 1000) {
+    lastMemorySample = now;
+    metricHandler({ name: 'memory:usedJSHeapSize', value: memory.usedJSHeapSize });
+  }
+};
+
+export default reportAppMetrics;
@@ -1 +1,154 @@
-import React from "react"; import { User } from "../types/User"; import "./UserTable.module.css"; interface UserTableProps { users: User[]; onUserClick: (user: User) => void; onDeleteUser: (userId: number) => void; } const UserTable: React.FC<UserTableProps> = ({ users, onUserClick, onDeleteUser }) => { const handleDeleteClick = (e: React.MouseEvent, userId: number) => { e.stopPropagation(); if (window.confirm("Are you sure you want to delete this user?")) { onDeleteUser(userId); } }; return ( <div className="table-container"> <table className="user-table"> <thead> <tr> <th>Name / Email</th> <th>Address</th> <th>Phone</th> <th>Website</th> <th>Company</th> <th>Actions</th> </tr> </thead> <tbody> {users.map((user) => ( <tr key={user.id} onClick={() => onUserClick(user)} className="user-row"> <td> <div className="user-name-email"> <div className="user-name">{user.name}</div> <div className="user-email">{user.email}</div> </div> </td> <td> <div className="user-address"> {user.address.street}, {user.address.suite}<br /> {user.address.city}, {user.address.zipcode} </div> </td> <td>{user.phone}</td> <td> <a href={`https://${user.website}`} target="_blank" rel="noopener noreferrer" onClick={(e) => e.stopPropagation()}> {user.website} </a> </td> <td>{user.company.name}</td> <td> <button className="delete-button" onClick={(e) => handleDeleteClick(e, user.id)}> Delete </button> </td> </tr> ))} </tbody> </table> </div> ); }; export default UserTable;
+import React, { memo, useEffect, useRef, useState } from "react";
+import { User } from "../types/User";
+import { UserList } from "../utils/UserList";
+import styles from "./UserTable.module.css";
+
+// Rows have a fixed height so the visible window can be computed from scrollTop
+export const ROW_HEIGHT = 80;
+// Extra rows rendered above and below the viewport
+const OVERSCAN = 8;
+// Start loading the next page this many rows before the end
+const LOAD_MORE_THRESHOLD = 50;
+
+interface UserTableProps {
+  users: UserList;
+  hasMore: boolean;
+  loadingMore: boolean;
+  error: string | null;
+  onLoadMore: () => void;
+  onUserClick: (user: User) => void;
+  onDeleteUser: (userId: number) => void;
+}
+
+interface UserRowProps {
+  user: User;
+  onUserClick: (user: User) => void;
+  onDeleteUser: (userId: number) => void;
+}
+
+const UserRow = memo(function UserRow({ user, onUserClick, onDeleteUser }: UserRowProps) {
+  const handleDeleteClick = (e: React.MouseEvent) => {
+    e.stopPropagation();
+    if (window.confirm("Are you sure you want to delete this user?")) {
+      onDeleteUser(user.id);
+    }
+  };
+
+  return (
+    <tr onClick={() => onUserClick(user)} className={styles["user-row"]} style={{ height: ROW_HEIGHT }}>
+      <td>
+        <div className={styles["user-name-email"]}>
+          <div className={styles["user-name"]}>{user.name}</div>
+          <div className={styles["user-email"]}>{user.email}</div>
+        </div>
+      </td>
+      <td>
+        <div className={styles["user-address"]}>
+          {user.address.street}, {user.address.suite}<br />
+          {user.address.city}, {user.address.zipcode}
+        </div>
+      </td>
+      <td>{user.phone}</td>
+      <td>
+        <a href={`https://${user.website}`} target="_blank" rel="noopener noreferrer" onClick={(e) => e.stopPropagation()}>
+          {user.website}
+        </a>
+      </td>
+      <td>{user.company.name}</td>
+      <td>
+        <button className={styles["delete-button"]} onClick={handleDeleteClick}>
+          Delete
+        </button>
+      </td>
+    </tr>
+  );
+});
+
+const UserTable: React.FC<UserTableProps> = ({
+  users,
+  hasMore,
+  loadingMore,
+  error,
+  onLoadMore,
+  onUserClick,
+  onDeleteUser,
+}) => {
+  const containerRef = useRef<HTMLDivElement>(null);
+  const frameRef = useRef<number | null>(null);
+  const [scrollTop, setScrollTop] = useState(0);
+  const [viewportHeight, setViewportHeight] = useState(window.innerHeight);
+
+  useEffect(() => {
+    const updateViewportHeight = () => {
+      setViewportHeight(containerRef.current?.clientHeight || window.innerHeight);
+    };
+    updateViewportHeight();
+    window.addEventListener("resize", updateViewportHeight);
+    return () => {
+      window.removeEventListener("resize", updateViewportHeight);
+      if (frameRef.current !== null) cancelAnimationFrame(frameRef.current);
+    };
+  }, []);
+
+  // Re-render at most once per animation frame while scrolling
+  const handleScroll = (e: React.UIEvent<HTMLDivElement>) => {
+    const container = e.currentTarget;
+    if (frameRef.current !== null) return;
+    frameRef.current = requestAnimationFrame(() => {
+      frameRef.current = null;
+      setScrollTop(container.scrollTop);
+    });
+  };
+
+  const start = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN);
+  const end = Math.min(users.length, Math.ceil((scrollTop + viewportHeight) / ROW_HEIGHT) + OVERSCAN);
+  const visibleUsers = users.slice(start, end);
+
+  useEffect(() => {
+    if (hasMore && !loadingMore && !error && end >= users.length - LOAD_MORE_THRESHOLD) {
+      onLoadMore();
+    }
+  }, [end, users.length, hasMore, loadingMore, error, onLoadMore]);
+
+  return (
+    <div className={styles["table-container"]} ref={containerRef} onScroll={handleScroll}>
+      <table className={styles["user-table"]}>
+        <thead>
+          <tr>
+            <th>Name / Email</th>
+            <th>Address</th>
+            <th>Phone</th>
+            <th>Website</th>
+            <th>Company</th>
+            <th>Actions</th>
+          </tr>
+        </thead>
+        <tbody>
+          {start > 0 && <tr aria-hidden="true" style={{ height: start * ROW_HEIGHT }} />}
+          {visibleUsers.map((user) => (
+            <UserRow key={user.id} user={user} onUserClick={onUserClick} onDeleteUser={onDeleteUser} />
+          ))}
+          {end < users.length && <tr aria-hidden="true" style={{ height: (users.length - end) * ROW_HEIGHT }} />}
+          {(loadingMore || error) && (
+            <tr>
+              <td colSpan={6} className={styles["table-status"]}>
+                {error ? (
+                  <>
+                    {error}{" "}
+                    <button className={styles["retry-button"]} onClick={onLoadMore}>
+                      Try Again
+                    </button>
+                  </>
+                ) : (
+                  "Loading more users..."
+                )}
+              </td>
+            </tr>
+          )}
+        </tbody>
+      </table>
+    </div>
+  );
+};
+
+export default UserTable;
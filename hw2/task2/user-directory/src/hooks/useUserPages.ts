@@ -0,0 +1,114 @@
+import { useCallback, useEffect, useRef, useState } from "react";
+import { User } from "../types/User";
+import { userService } from "../services/userService";
+import { UserList } from "../utils/UserList";
+
+export const PAGE_SIZE = 100;
+
+interface PendingPage {
+  offset: number;
+  controller: AbortController;
+  promise: Promise<User[]>;
+}
+
+/**
+ * Loads users page by page, keeping the next page prefetched and aborting
+ * requests whose offset is no longer current.
+ */
+export const useUserPages = (pageSize: number = PAGE_SIZE) => {
+  const [users, setUsers] = useState<UserList>(UserList.empty);
+  const [hasMore, setHasMore] = useState(true);
+  const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [error, setError] = useState<string | null>(null);
+
+  // Server offset of the next page, and requests in flight
+  const offsetRef = useRef(0);
+  const hasMoreRef = useRef(true);
+  const currentRef = useRef<PendingPage | null>(null);
+  const prefetchRef = useRef<PendingPage | null>(null);
+
+  const requestPage = useCallback(
+    (offset: number): PendingPage => {
+      const controller = new AbortController();
+      const promise = userService.getUsersPage(offset, pageSize, controller.signal);
+      // Discarded prefetches are never awaited
+      promise.catch(() => undefined);
+      return { offset, controller, promise };
+    },
+    [pageSize]
+  );
+
+  const cancelPending = useCallback(() => {
+    currentRef.current?.controller.abort();
+    currentRef.current = null;
+    prefetchRef.current?.controller.abort();
+    prefetchRef.current = null;
+  }, []);
+
+  const loadMore = useCallback(async () => {
+    if (currentRef.current || !hasMoreRef.current) return;
+
+    const offset = offsetRef.current;
+    const prefetched = prefetchRef.current;
+    prefetchRef.current = null;
+    if (prefetched && prefetched.offset !== offset) prefetched.controller.abort();
+    const pending = prefetched && prefetched.offset === offset ? prefetched : requestPage(offset);
+
+    currentRef.current = pending;
+    setLoadingMore(true);
+    try {
+      const page = await pending.promise;
+      if (currentRef.current !== pending) return;
+
+      offsetRef.current = offset + page.length;
+      hasMoreRef.current = page.length === pageSize;
+      setUsers((list) => list.append(page));
+      setHasMore(hasMoreRef.current);
+      setError(null);
+      if (hasMoreRef.current) {
+        prefetchRef.current = requestPage(offsetRef.current);
+      }
+    } catch (err) {
+      if (currentRef.current !== pending || userService.isAbortError(err)) return;
+      setError("Failed to fetch users. Please try again later.");
+    } finally {
+      if (currentRef.current === pending) {
+        currentRef.current = null;
+        setLoading(false);
+        setLoadingMore(false);
+      }
+    }
+  }, [pageSize, requestPage]);
+
+  const reload = useCallback(() => {
+    cancelPending();
+    offsetRef.current = 0;
+    hasMoreRef.current = true;
+    setUsers(UserList.empty);
+    setHasMore(true);
+    setError(null);
+    setLoading(true);
+    loadMore();
+  }, [cancelPending, loadMore]);
+
+  const removeUser = useCallback(
+    (userId: number, removedOnServer: boolean) => {
+      setUsers((list) => list.remove(userId));
+      if (removedOnServer) {
+        // Later rows moved up by one on the server, so pending pages are stale
+        offsetRef.current = Math.max(0, offsetRef.current - 1);
+        cancelPending();
+        setLoadingMore(false);
+      }
+    },
+    [cancelPending]
+  );
+
+  useEffect(() => {
+    reload();
+    return cancelPending;
+  }, [reload, cancelPending]);
+
+  return { users, hasMore, loading, loadingMore, error, loadMore, reload, removeUser };
+};
@@ -3,6 +3,7 @@ import ReactDOM from 'react-dom/client';
 import './index.css';
 import App from './App';
 import reportWebVitals from './reportWebVitals';
+import reportAppMetrics from './appMetrics';
 
 const root = ReactDOM.createRoot(
   document.getElementById('root') as HTMLElement
@@ -16,4 +17,8 @@ root.render(
 // If you want to start measuring performance in your app, pass a function
 // to log results (for example: reportWebVitals(console.log))
 // or send to an analytics endpoint. Learn more: https://bit.ly/CRA-vitals
-reportWebVitals();
+// Set REACT_APP_REPORT_VITALS=true to log web vitals, UserTable render times
+// and JS heap usage to the console.
+const logMetrics = process.env.REACT_APP_REPORT_VITALS === 'true';
+reportWebVitals(logMetrics ? console.log : undefined);
+reportAppMetrics(logMetrics ? console.log : undefined);
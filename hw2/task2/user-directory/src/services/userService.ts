@@ -1 +1,54 @@
-import { User } from "../types/User"; const API_BASE_URL = "https://jsonplaceholder.typicode.com"; export const userService = { async getUsers(): Promise<User[]> { try { const response = await fetch(`${API_BASE_URL}/users`); if (!response.ok) { throw new Error("Failed to fetch users"); } return await response.json(); } catch (error) { console.error("Error fetching users:", error); throw error; } }, async deleteUser(id: number): Promise<void> { try { const response = await fetch(`${API_BASE_URL}/users/${id}`, { method: "DELETE", }); if (!response.ok) { throw new Error("Failed to delete user"); } } catch (error) { console.error("Error deleting user:", error); throw error; } } };
+import { User } from "../types/User";
+
+const API_BASE_URL = process.env.REACT_APP_API_URL || "https://jsonplaceholder.typicode.com";
+const API_TOKEN = process.env.REACT_APP_API_TOKEN;
+
+const authHeaders = (): Record<string, string> =>
+  API_TOKEN ? { Authorization: `Bearer ${API_TOKEN}` } : {};
+
+const isAbortError = (error: unknown): boolean =>
+  error instanceof Error && error.name === "AbortError";
+
+export const userService = {
+  async getUsersPage(offset: number, limit: number, signal?: AbortSignal): Promise<User[]> {
+    // `_start`/`_limit` page JSONPlaceholder, `skip`/`limit` page our own backend
+    const params = new URLSearchParams({
+      _start: String(offset),
+      _limit: String(limit),
+      skip: String(offset),
+      limit: String(limit),
+    });
+    try {
+      const response = await fetch(`${API_BASE_URL}/users?${params}`, {
+        headers: authHeaders(),
+        signal,
+      });
+      if (!response.ok) {
+        throw new Error("Failed to fetch users");
+      }
+      return await response.json();
+    } catch (error) {
+      if (!isAbortError(error)) {
+        console.error("Error fetching users:", error);
+      }
+      throw error;
+    }
+  },
+
+  async deleteUser(id: number): Promise<void> {
+    try {
+      const response = await fetch(`${API_BASE_URL}/users/${id}`, {
+        method: "DELETE",
+        headers: authHeaders(),
+      });
+      if (!response.ok) {
+        throw new Error("Failed to delete user");
+      }
+    } catch (error) {
+      console.error("Error deleting user:", error);
+      throw error;
+    }
+  },
+
+  isAbortError,
+};
@@ -0,0 +1,32 @@
+import { User } from "../types/User";
+import { UserList } from "./UserList";
+
+const makeUser = (id: number): User => ({
+  id,
+  name: `User ${id}`,
+  username: `user${id}`,
+  email: `user${id}@example.com`,
+  address: { street: "", suite: "", city: "", zipcode: "", geo: { lat: "0", lng: "0" } },
+  phone: "",
+  website: "",
+  company: { name: "", catchPhrase: "", bs: "" },
+});
+
+const ids = (users: User[]) => users.map((user) => user.id);
+
+test("appends pages and reads across them", () => {
+  const list = UserList.empty.append([1, 2, 3].map(makeUser)).append([4, 5].map(makeUser));
+  expect(list.length).toBe(5);
+  expect(list.get(3)?.id).toBe(4);
+  expect(ids(list.slice(1, 5))).toEqual([2, 3, 4, 5]);
+});
+
+test("removes a user without touching other chunks", () => {
+  const first = [1, 2].map(makeUser);
+  const list = UserList.empty.append(first).append([3].map(makeUser));
+  const removed = list.remove(3);
+  expect(removed.length).toBe(2);
+  expect(ids(removed.slice(0, 10))).toEqual([1, 2]);
+  expect(removed.get(0)).toBe(first[0]);
+  expect(list.length).toBe(3);
+});
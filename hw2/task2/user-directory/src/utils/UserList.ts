@@ -0,0 +1,74 @@
+import { User } from "../types/User";
+
+/**
+ * Immutable list of users stored as page-sized chunks.
+ * Appending a page or removing a user copies one chunk, not the whole list.
+ */
+export class UserList {
+  static readonly empty = new UserList([]);
+
+  readonly length: number;
+  // Index of the first user of each chunk
+  private readonly offsets: number[];
+
+  private constructor(private readonly pages: User[][]) {
+    this.offsets = [];
+    let length = 0;
+    for (const page of pages) {
+      this.offsets.push(length);
+      length += page.length;
+    }
+    this.length = length;
+  }
+
+  append(page: User[]): UserList {
+    return page.length ? new UserList([...this.pages, page]) : this;
+  }
+
+  remove(userId: number): UserList {
+    const pageIndex = this.pages.findIndex((page) => page.some((user) => user.id === userId));
+    if (pageIndex === -1) return this;
+
+    const page = this.pages[pageIndex].filter((user) => user.id !== userId);
+    const pages = [...this.pages];
+    // Drop emptied chunks so every chunk owns at least one index
+    if (page.length) pages[pageIndex] = page;
+    else pages.splice(pageIndex, 1);
+    return new UserList(pages);
+  }
+
+  get(index: number): User | undefined {
+    if (index < 0 || index >= this.length) return undefined;
+    const pageIndex = this.pageOf(index);
+    return this.pages[pageIndex][index - this.offsets[pageIndex]];
+  }
+
+  slice(start: number, end: number): User[] {
+    start = Math.max(0, start);
+    end = Math.min(this.length, end);
+    const users: User[] = [];
+    if (start >= end) return users;
+
+    let pageIndex = this.pageOf(start);
+    let index = start - this.offsets[pageIndex];
+    while (users.length < end - start) {
+      const page = this.pages[pageIndex];
+      users.push(...page.slice(index, index + end - start - users.length));
+      pageIndex += 1;
+      index = 0;
+    }
+    return users;
+  }
+
+  private pageOf(index: number): number {
+    // Last chunk starting at or before index
+    let low = 0;
+    let high = this.offsets.length - 1;
+    while (low < high) {
+      const middle = (low + high + 1) >> 1;
+      if (this.offsets[middle] <= index) low = middle;
+      else high = middle - 1;
+    }
+    return low;
+  }
+}